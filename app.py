@@ -1,10 +1,11 @@
-import url_to_json
-import file_to_json
-import text_to_speech
 import os
-import video_generator
+import metrics
+
+# Stage modules are imported where they are used so a run only loads the
+# dependencies of the stages it reaches.
 
 def main():
+    metrics.configure()
     print("🎬 Content Gatherer - Video Generator")
     print("Choose your input method:")
     print("1. URL (extract from web article)")
@@ -16,7 +17,8 @@ def main():
         if choice == "1":
             # URL input (existing workflow)
             url = input("Enter URL: ")
-            folder_path, summary = url_to_json.create_json_from_url(url)
+            import url_to_json
+            folder_path, summary, duplicate = url_to_json.create_json_from_url(url)
             break
         elif choice == "2":
             # File input (new workflow)
@@ -29,14 +31,24 @@ def main():
                 print("- Rest: Your story summary/content")
                 continue
             
-            folder_path, summary = file_to_json.create_json_from_file(input_file)
+            import file_to_json
+            folder_path, summary, duplicate = file_to_json.create_json_from_file(input_file)
             break
         else:
             print("❌ Invalid choice. Please enter 1 or 2.")
     
+    # A copy of an earlier story already has (or is getting) its own audio and video
+    if duplicate:
+        print(f"\n⏭️  Same story as an earlier job, not regenerating audio and video")
+        print(f"📁 Output folder: {folder_path}")
+        return
+
     # Generate audio and video (same for both workflows)
-    audio_path = os.path.join(folder_path, "summary_audio.mp3")
-    text_to_speech.tts_elevenlabs(summary, audio_path, "sk_85fee4f798f30152c13019e802dc41aa9b38407bdb6d32ac")
+    # Backend and fallback come from TTS_BACKEND / TTS_FALLBACK (default: ElevenLabs only)
+    api_key = os.getenv("ELEVENLABS_API_KEY", "sk_85fee4f798f30152c13019e802dc41aa9b38407bdb6d32ac")
+    import text_to_speech
+    text_to_speech.tts_checkpointed(summary, folder_path, api_key)
+    import video_generator
     video_generator.create_slideshow(folder_path)
     
     print(f"\n🎉 Content generation complete!")
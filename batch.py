@@ -0,0 +1,165 @@
+import argparse
+import json
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import url_to_json
+import file_to_json
+import news_extract
+import dedup
+import text_to_speech
+import video_generator
+import stages
+import metrics
+
+def read_inputs(inputs_path):
+    """
+    Read a batch file: one URL or path to a text input file per line.
+    Blank lines and lines starting with '#' are ignored.
+    """
+    with open(inputs_path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+def render_job(folder_path, metrics_log=None):
+    """
+    Render in a worker process and hand back the metrics recorded there.
+    Spans are also written to metrics_log from the worker as they finish.
+    """
+    metrics.configure_log(metrics_log)
+    video_generator.create_slideshow(folder_path, False)
+    return metrics.drain()
+
+def process_input(item, output_folder, api_key, render_pool, tts_backend=None, tts_fallback=None,
+                  metrics_log=None):
+    """
+    Run one article through every stage: extraction, LLM and images, TTS and render.
+    Each stage waits for a slot of its own, so slow stages don't starve fast ones.
+
+    Returns:
+        tuple: (folder_path, duplicate). A duplicate's folder belongs to the
+            earlier job, which produces the audio and video.
+    """
+    if item.startswith(('http://', 'https://')):
+        folder_path, summary, duplicate = url_to_json.create_json_from_url(item, output_folder)
+    else:
+        folder_path, summary, duplicate = file_to_json.create_json_from_file(item, output_folder)
+
+    if duplicate:
+        return folder_path, True
+
+    with stages.slot("tts"):
+        text_to_speech.tts_checkpointed(summary, folder_path, api_key, backend=tts_backend, fallback=tts_fallback)
+
+    # Render runs in a separate process so it can use a whole core
+    with stages.slot("render"):
+        metrics.merge(render_pool.submit(render_job, folder_path, metrics_log).result())
+
+    return folder_path, False
+
+def job_key(item):
+    """Key identifying the job an input maps to: tracking/AMP variants of a URL share one."""
+    if item.startswith(('http://', 'https://')):
+        return dedup.canonicalize_url(item)
+    return os.path.abspath(item)
+
+def run_batch(items, output_folder="output", api_key=None, workers=32, limits=None,
+              tts_backend=None, tts_fallback=None, metrics_log=None):
+    """
+    Process many articles concurrently with per-stage concurrency limits.
+
+    Args:
+        items (list): URLs or paths to text input files
+        output_folder (str): Folder to create article folders in
+        api_key (str): ElevenLabs API key
+        workers (int): Maximum articles in flight at once
+        limits (dict, optional): Stage name -> concurrency limit (see stages.DEFAULT_LIMITS)
+        tts_backend (str, optional): TTS backend for every job (see text_to_speech.TTS_BACKENDS)
+        tts_fallback (str, optional): TTS backend used when the first one fails
+        metrics_log (str, optional): Structured stage log render workers also write
+            to. Defaults to the METRICS_LOG env var.
+
+    Returns:
+        list: One result dict per input, in input order
+    """
+    stages.configure(limits)
+    metrics_log = metrics_log or os.getenv("METRICS_LOG")
+    render_workers = (limits or {}).get("render", stages.DEFAULT_LIMITS["render"])
+    results = [None] * len(items)
+
+    # Inputs for the same job would share a folder, so only the first one runs
+    first_of = {}
+    for i, item in enumerate(items):
+        first_of.setdefault(job_key(item), i)
+    repeats = {i: first_of[job_key(item)] for i, item in enumerate(items) if first_of[job_key(item)] != i}
+
+    # Spawned, not forked: workers start on the first submit from a job thread,
+    # while other threads may hold module locks a forked child would inherit
+    mp_context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=render_workers, mp_context=mp_context) as render_pool, \
+            ProcessPoolExecutor(mp_context=mp_context) as parse_pool, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        # Article parsing is CPU-bound, so job threads hand it to worker processes
+        news_extract.use_parse_pool(parse_pool)
+        try:
+            futures = {
+                executor.submit(process_input, item, output_folder, api_key, render_pool, tts_backend, tts_fallback,
+                                metrics_log): i
+                for i, item in enumerate(items) if i not in repeats
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                i = futures[future]
+                try:
+                    folder_path, duplicate = future.result()
+                    print(f"✅ [{done}/{len(futures)}] Finished {items[i]} -> {folder_path}"
+                          + (" (duplicate, no new video)" if duplicate else ""))
+                    results[i] = {"input": items[i], "status": "success", "folder": folder_path,
+                                  "duplicate": duplicate}
+                except Exception as e:
+                    print(f"❌ [{done}/{len(futures)}] Failed {items[i]}: {e}")
+                    results[i] = {"input": items[i], "status": "error", "error": str(e)}
+        finally:
+            news_extract.use_parse_pool(None)
+
+    for i, first in repeats.items():
+        print(f"⏭️  {items[i]} is the same job as {items[first]}")
+        results[i] = {**results[first], "input": items[i], "duplicate": True}
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate videos for a batch of URLs or text files.")
+    parser.add_argument("inputs", help="File with one URL or text input path per line")
+    parser.add_argument("--output", default="output", help="Output folder (default: output)")
+    parser.add_argument("--workers", type=int, default=32, help="Articles in flight at once")
+    for name, default in stages.DEFAULT_LIMITS.items():
+        parser.add_argument(f"--{name}-limit", type=int, default=default,
+                            help=f"Concurrent {name} jobs (default: {default})")
+    parser.add_argument("--tts-backend", choices=list(text_to_speech.TTS_BACKENDS),
+                        default=os.getenv("TTS_BACKEND", "elevenlabs"), help="TTS backend (default: elevenlabs)")
+    parser.add_argument("--tts-fallback", choices=list(text_to_speech.TTS_BACKENDS),
+                        default=os.getenv("TTS_FALLBACK"), help="TTS backend to use when the first one fails")
+    parser.add_argument("--report", help="Write the per-input results as JSON to this path")
+    parser.add_argument("--metrics-log", help="Write structured stage logs (JSON lines) here, '-' for stderr")
+    parser.add_argument("--metrics-file", help="Write Prometheus text-format metrics here when the run ends")
+    args = parser.parse_args()
+    metrics.configure(args.metrics_log, args.metrics_file)
+
+    api_key = os.getenv("ELEVENLABS_API_KEY")
+    if not api_key and "elevenlabs" in (args.tts_backend, args.tts_fallback):
+        parser.error("ELEVENLABS_API_KEY must be set to use the elevenlabs TTS backend")
+
+    limits = {name: getattr(args, f"{name}_limit") for name in stages.DEFAULT_LIMITS}
+    items = read_inputs(args.inputs)
+    print(f"🎬 Batch run: {len(items)} inputs")
+    results = run_batch(items, args.output, api_key, args.workers, limits, args.tts_backend, args.tts_fallback,
+                        args.metrics_log)
+
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    print(f"\n📊 {succeeded}/{len(results)} videos generated")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"📁 Report saved: {args.report}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Render benchmarks for video_generator and insert_thumbnail.
+
+Generates synthetic images and tone/silent audio locally, then times
+resize_and_pad, create_slideshow and insert_thumbnail across a grid of
+parameters. Fixtures are built in a separate setup process and each case
+runs in a fresh process, so peak RSS covers only the measured call.
+
+    python benchmarks/bench_render.py --output bench_results.json
+    python benchmarks/bench_render.py --images 3 6 --audio-seconds 30 --codecs libx264 --modes ffmpeg
+    python benchmarks/bench_render.py --profiles still motion --modes ffmpeg
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def make_image(path, width, height, seed):
+    """Write a synthetic JPEG with a gradient and some structure so it compresses like a photo."""
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    noise = rng.normal(0, 12, size=(height, width, 3))
+    Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8)).save(path, quality=90)
+
+def make_audio(path, seconds, tone=True):
+    """Write an MP3 of a sine tone (or silence) using ffmpeg's lavfi sources."""
+    import encoders
+    if tone:
+        source = f"sine=frequency=440:duration={seconds}"
+    else:
+        source = f"anullsrc=r=44100:cl=mono,atrim=duration={seconds}"
+    subprocess.run(
+        [encoders.ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y",
+         "-f", "lavfi", "-i", source, "-c:a", "libmp3lame", "-b:a", "128k", path],
+        check=True,
+    )
+
+def make_fixture(folder, image_count, audio_seconds, tone=True):
+    """Create an article-like folder with imgN.jpg files and summary_audio.mp3."""
+    os.makedirs(folder, exist_ok=True)
+    sizes = [(1600, 1067), (1200, 1600), (2048, 1365), (800, 800)]
+    for i in range(image_count):
+        width, height = sizes[i % len(sizes)]
+        make_image(os.path.join(folder, f"img{i}.jpg"), width, height, seed=i)
+    make_audio(os.path.join(folder, "summary_audio.mp3"), audio_seconds, tone)
+
+def peak_rss_mb():
+    """Peak RSS of this process and of its largest finished child (ffmpeg), in MB."""
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    per_mb = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {"self": own / per_mb, "children": children / per_mb}
+
+def setup_case(case, folder):
+    """Build the inputs for a case in folder (run in its own process, outside the measurement)."""
+    make_fixture(folder, case["images"], case["audio_seconds"], case.get("tone", True))
+    if case["target"] == "insert_thumbnail":
+        import video_generator
+        video_generator.create_slideshow(
+            folder, use_custom_thumbnail=False, codec=case["codec"], mode="ffmpeg", fps=case["fps"]
+        )
+        make_image(os.path.join(folder, "thumb.png"), 1080, 1080, seed=99)
+
+def _setup_case(case, folder, queue):
+    try:
+        setup_case(case, folder)
+        queue.put(None)
+    except Exception as e:
+        queue.put(str(e))
+
+def _run_case(case, folder, queue):
+    try:
+        queue.put(run_case(case, folder))
+    except Exception as e:
+        queue.put({**case, "error": str(e)})
+
+def _in_process(ctx, target, *args):
+    """Run target(*args, queue) in a fresh process and return what it put on the queue."""
+    queue = ctx.Queue()
+    process = ctx.Process(target=target, args=(*args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def run_case(case, folder):
+    """Run one benchmark case against a prepared folder in the current process and return its measurements."""
+    import video_generator
+    import insert_thumbnail
+    from PIL import Image
+
+    result = dict(case)
+
+    if case["target"] == "resize_and_pad":
+        img = Image.open(os.path.join(folder, "img0.jpg")).convert("RGB")
+        start = time.perf_counter()
+        for _ in range(case["images"]):
+            video_generator.resize_and_pad(img)
+        result["wall_seconds"] = time.perf_counter() - start
+        result["output_bytes"] = None
+
+    elif case["target"] == "create_slideshow":
+        start = time.perf_counter()
+        output = video_generator.create_slideshow(
+            folder, use_custom_thumbnail=False, codec=case["codec"], mode=case["mode"], fps=case["fps"],
+            profile=case["profile"],
+        )
+        result["wall_seconds"] = time.perf_counter() - start
+        result["output_bytes"] = os.path.getsize(output)
+
+    elif case["target"] == "insert_thumbnail":
+        video = os.path.join(folder, "summary_video.mp4")
+        thumbnail = os.path.join(folder, "thumb.png")
+        start = time.perf_counter()
+        output = insert_thumbnail.insert_thumbnail(video, thumbnail)
+        result["wall_seconds"] = time.perf_counter() - start
+        result["output_bytes"] = os.path.getsize(output)
+
+    rss = peak_rss_mb()
+    result["peak_rss_mb"] = round(rss["self"], 1)
+    result["peak_child_rss_mb"] = round(rss["children"], 1)
+    result["wall_seconds"] = round(result["wall_seconds"], 4)
+    return result
+
+def build_cases(args):
+    cases = [{"target": "resize_and_pad", "images": n, "audio_seconds": 1} for n in args.images]
+    for n, seconds, fps, codec, mode, profile in itertools.product(
+        args.images, args.audio_seconds, args.fps, args.codecs, args.modes, args.profiles
+    ):
+        cases.append({
+            "target": "create_slideshow", "images": n, "audio_seconds": seconds,
+            "fps": fps, "codec": codec, "mode": mode, "profile": profile, "tone": not args.silent,
+        })
+    for seconds, codec in itertools.product(args.audio_seconds, args.codecs):
+        cases.append({
+            "target": "insert_thumbnail", "images": args.images[0], "audio_seconds": seconds,
+            "fps": args.fps[0], "codec": codec, "tone": not args.silent,
+        })
+    return cases
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the render path with synthetic fixtures.")
+    parser.add_argument("--images", type=int, nargs="+", default=[3, 6, 12])
+    parser.add_argument("--audio-seconds", type=float, nargs="+", default=[15, 60])
+    parser.add_argument("--fps", type=int, nargs="+", default=[24])
+    parser.add_argument("--codecs", nargs="+", default=["libx264"])
+    parser.add_argument("--modes", nargs="+", default=["ffmpeg", "segments", "moviepy"])
+    parser.add_argument("--profiles", nargs="+", default=["still", "motion"])
+    parser.add_argument("--silent", action="store_true", help="Use silent audio instead of a tone")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file to write results to")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    cases = build_cases(args)
+    for i, case in enumerate(cases, 1):
+        with tempfile.TemporaryDirectory(prefix="bench_") as folder:
+            setup_error = _in_process(ctx, _setup_case, case, folder)
+            if setup_error:
+                result = {**case, "error": f"setup failed: {setup_error}"}
+            else:
+                result = _in_process(ctx, _run_case, case, folder)
+        results.append(result)
+        summary = result.get("error") or f"{result['wall_seconds']:.3f}s, {result['peak_rss_mb']} MB"
+        print(f"[{i}/{len(cases)}] {case}: {summary}")
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"📁 Results saved: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Startup-time benchmark for the entry points.
+
+Imports each module in a fresh interpreter with `python -X importtime`,
+records the wall time, the total cumulative import time and the slowest
+top-level imports, and checks which heavy dependencies got loaded. Each run
+is appended to a JSON-lines history so regressions show up over time.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --modules app batch --repeat 10 --max-ms 300
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages that should only load when the stage needing them runs
+HEAVY_MODULES = ["moviepy", "numpy", "imageio", "PIL", "newspaper", "ddgs", "tiktoken"]
+
+DEFAULT_MODULES = ["app", "batch", "url_to_json", "file_to_json", "text_to_speech", "video_generator"]
+
+def parse_importtime(stderr):
+    """
+    Parse `-X importtime` output into (module, self_us, cumulative_us) rows.
+    Only top-level imports (no leading indentation in the name) are kept.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if name.startswith("  "):
+            continue
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+def measure(module):
+    """Import module once in a fresh interpreter and return its timings."""
+    probe = (
+        f"import sys, json; import {module}; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed"
+        return {"error": error}
+
+    rows = parse_importtime(result.stderr)
+    return {
+        "wall_ms": wall_ms,
+        "import_ms": sum(cumulative for _, _, cumulative in rows) / 1000,
+        "slowest": sorted(rows, key=lambda row: row[2], reverse=True)[:5],
+        "heavy_loaded": json.loads(result.stdout.strip().splitlines()[-1]),
+    }
+
+def bench_module(module, repeat):
+    """Median timings of repeat fresh imports of module."""
+    runs = [measure(module) for _ in range(repeat)]
+    errors = [run["error"] for run in runs if "error" in run]
+    if errors:
+        return {"module": module, "error": errors[0]}
+    return {
+        "module": module,
+        "wall_ms": round(statistics.median(run["wall_ms"] for run in runs), 1),
+        "import_ms": round(statistics.median(run["import_ms"] for run in runs), 1),
+        "slowest": [
+            {"module": name, "cumulative_ms": round(cumulative / 1000, 1)}
+            for name, _, cumulative in runs[-1]["slowest"]
+        ],
+        "heavy_loaded": runs[-1]["heavy_loaded"],
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time of the entry points.")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh imports per module (median is kept)")
+    parser.add_argument("--history", default=os.path.join(ROOT, "benchmarks", "startup_history.jsonl"),
+                        help="JSON-lines file each run is appended to")
+    parser.add_argument("--max-ms", type=float, help="Exit non-zero if any module's wall time exceeds this")
+    args = parser.parse_args()
+
+    results = []
+    for module in args.modules:
+        result = bench_module(module, args.repeat)
+        results.append(result)
+        if "error" in result:
+            print(f"❌ {module}: {result['error']}")
+            continue
+        heavy = ", ".join(result["heavy_loaded"]) or "none"
+        print(f"⏱️  {module}: {result['wall_ms']:.1f} ms wall, {result['import_ms']:.1f} ms importing "
+              f"(heavy deps loaded: {heavy})")
+
+    record = {
+        "created_at": datetime.now().isoformat(),
+        "revision": git_revision(),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    with open(args.history, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+    print(f"📁 Appended to history: {args.history}")
+
+    if args.max_ms is not None:
+        slow = [r["module"] for r in results if r.get("wall_ms", 0) > args.max_ms]
+        if slow:
+            print(f"❌ Over the {args.max_ms:.0f} ms budget: {', '.join(slow)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import manifest
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+# Query parameters that only track the click, never change the story
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "igshid", "mc_cid", "mc_eid", "ref", "ref_src",
+    "cmpid", "ocid", "smid", "smtyp", "taid", "share", "amp", "outputtype",
+}
+TRACKING_PREFIXES = ("utm_", "at_", "ga_", "_hs")
+
+NUM_PERMUTATIONS = 128
+SHINGLE_SIZE = 5
+# Texts with fewer shingles (empty extractions, paywall stubs) are too short to compare
+MIN_SHINGLES = 20
+DUPLICATE_SIMILARITY = 0.8
+_MERSENNE_PRIME = (1 << 61) - 1
+
+def canonicalize_url(url):
+    """
+    Normalise a story URL so tracking variants and AMP pages of the same
+    article map to the same string.
+    """
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower()
+    for prefix in ("www.", "amp.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+
+    path = parsed.path
+    path = re.sub(r"/amp(/|$)", "/", path)
+    path = re.sub(r"\.amp(\.html?)?$", r"\1", path)
+    path = re.sub(r"/+", "/", path).rstrip("/") or "/"
+
+    query = [
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    return urlunparse(("https", host, path, "", urlencode(sorted(query)), ""))
+
+def _shingles(text, size=SHINGLE_SIZE):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _permutations():
+    rng_state = hashlib.sha256(b"content-gatherer-minhash").digest()
+    params = []
+    while len(params) < NUM_PERMUTATIONS:
+        rng_state = hashlib.sha256(rng_state).digest()
+        a = int.from_bytes(rng_state[:8], "big") % (_MERSENNE_PRIME - 1) + 1
+        b = int.from_bytes(rng_state[8:16], "big") % _MERSENNE_PRIME
+        params.append((a, b))
+    return params
+
+_PERMUTATIONS = _permutations()
+
+def minhash(text):
+    """
+    MinHash signature of the text's word shingles (NUM_PERMUTATIONS integers),
+    or None if the text has fewer than MIN_SHINGLES shingles and so can't be
+    compared reliably.
+    """
+    shingles = _shingles(text)
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERMUTATIONS
+
+class DedupIndex:
+    """
+    Index of past jobs in an output folder: the text signature of each story,
+    mapped to the folder holding its output.
+
+    Jobs still producing their JSON in this process are tracked as pending, so
+    a near-duplicate started alongside them in the same batch waits for the
+    first one instead of doing the work twice.
+    """
+
+    def __init__(self, output_folder="output"):
+        self.path = os.path.join(output_folder, ".dedup_index.json")
+        self.lock = threading.Lock()
+        self.entries = self._load()
+        self.pending = {}  # folder -> (signature, threading.Event set when that job finishes)
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return []
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+    def claim(self, signature, folder, threshold=DUPLICATE_SIMILARITY, usable=None):
+        """
+        Find the most similar finished or in-progress story above threshold.
+        If there is none, folder is registered as in progress for this story
+        and must later call add() (on success) or release() (on failure).
+
+        Args:
+            signature (list): MinHash signature of the story
+            folder (str): Job folder asking
+            threshold (float): Minimum estimated similarity
+            usable (callable, optional): Finished folders are only matched if usable(folder)
+
+        Returns:
+            tuple: (None, None) if folder now owns the story, (existing, None)
+                for a finished job, or (existing, event) for a job still in
+                progress; wait on event, then claim again.
+        """
+        best_folder, best_score, best_event = None, threshold, None
+        with self.lock:
+            for entry in self.entries:
+                if entry["folder"] == folder or not os.path.isdir(entry["folder"]):
+                    continue
+                score = similarity(signature, entry["signature"])
+                if score >= best_score and (usable is None or usable(entry["folder"])):
+                    best_folder, best_score, best_event = entry["folder"], score, None
+            for other, (other_signature, event) in self.pending.items():
+                if other == folder:
+                    continue
+                score = similarity(signature, other_signature)
+                if score >= best_score:
+                    best_folder, best_score, best_event = other, score, event
+            if best_folder is None:
+                self.pending[folder] = (signature, threading.Event())
+        return best_folder, best_event
+
+    def release(self, folder):
+        """Drop folder's in-progress claim (if any) and wake jobs waiting on it."""
+        with self.lock:
+            pending = self.pending.pop(folder, None)
+        if pending is not None:
+            pending[1].set()
+
+    def add(self, signature, folder):
+        """Record a finished job and release its in-progress claim (signature None is not indexed)."""
+        if signature is None:
+            self.release(folder)
+            return
+        with self.lock:
+            self.entries = [e for e in self.entries if e["folder"] != folder]
+            self.entries.append({"signature": signature, "folder": folder})
+            self._save()
+        self.release(folder)
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(output_folder="output"):
+    """Shared DedupIndex for an output folder (one instance per process)."""
+    key = os.path.abspath(output_folder)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = DedupIndex(output_folder)
+        return _indexes[key]
+
+def read_summary(folder_path):
+    """Summary from the finished JSON in a job folder, or None if that job never completed."""
+    outputs = manifest.Manifest(folder_path).get("json", "outputs", {})
+    for name in outputs:
+        try:
+            with open(os.path.join(folder_path, name), "r", encoding="utf-8") as f:
+                return json.load(f)["summary"]
+        except (OSError, json.JSONDecodeError, KeyError):
+            return None
+    return None
+
+def find_duplicate(output_folder, signature, folder_path):
+    """
+    Look for a job whose text is a near-duplicate of signature. If that job is
+    still running in this process, wait for it to finish first.
+
+    When nothing matches, folder_path becomes the owner of the story: the
+    caller must call get_index(output_folder).add() once its JSON is written,
+    or .release() if it fails.
+
+    Returns:
+        tuple: (folder, summary) of the existing job, or None (always None
+            when signature is None, i.e. the text is too short to compare)
+    """
+    if signature is None:
+        return None
+    index = get_index(output_folder)
+    while True:
+        existing, in_progress = index.claim(
+            signature, folder_path, usable=lambda folder: read_summary(folder) is not None
+        )
+        if existing is None:
+            return None
+        if in_progress is not None:
+            print(f"⏳ Waiting for {existing}, which is producing the same story")
+            in_progress.wait()
+            continue
+        summary = read_summary(existing)
+        if summary is not None:
+            return existing, summary
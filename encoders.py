@@ -0,0 +1,171 @@
+import json
+import os
+import platform
+import shutil
+import subprocess
+from functools import lru_cache
+
+# Fastest first. Hardware encoders are only used if a test encode succeeds,
+# since ffmpeg lists them even when no matching device is present.
+ENCODER_PREFERENCE = [
+    "h264_nvenc",
+    "h264_qsv",
+    "h264_videotoolbox",
+    "libx264",
+    "libx265",
+]
+
+# Per-encoder tuning passed to MoviePy's write_videofile / ffmpeg
+ENCODER_SETTINGS = {
+    "h264_nvenc": {"preset": "p4", "ffmpeg_params": ["-pix_fmt", "yuv420p", "-b:v", "3M"]},
+    "h264_qsv": {"preset": "veryfast", "ffmpeg_params": ["-pix_fmt", "nv12", "-b:v", "3M"]},
+    "h264_videotoolbox": {"preset": "veryfast", "ffmpeg_params": ["-pix_fmt", "yuv420p", "-b:v", "3M"]},
+    "libx264": {"preset": "veryfast", "ffmpeg_params": ["-pix_fmt", "yuv420p", "-b:v", "3M"]},
+    "libx265": {"preset": "fast", "ffmpeg_params": ["-pix_fmt", "yuv420p", "-b:v", "2M", "-tag:v", "hvc1"]},
+}
+
+# Quality-targeted rate control for slideshows of still images, used instead of
+# the fixed bitrate above. A static slide costs almost nothing after its first
+# frame, so a bitrate target only wastes bits (and encode time) on repeats.
+STILL_SETTINGS = {
+    "h264_nvenc": ["-pix_fmt", "yuv420p", "-rc", "vbr", "-cq", "28", "-b:v", "0"],
+    "h264_qsv": ["-pix_fmt", "nv12", "-global_quality", "25"],
+    "h264_videotoolbox": ["-pix_fmt", "yuv420p", "-q:v", "60"],
+    "libx264": ["-pix_fmt", "yuv420p", "-crf", "23", "-tune", "stillimage"],
+    "libx265": ["-pix_fmt", "yuv420p", "-crf", "26", "-tag:v", "hvc1"],
+}
+
+PROBE_CACHE_PATH = os.getenv("ENCODER_PROBE_CACHE", "cache/encoders.json")
+
+def ffmpeg_binary():
+    """Path of the ffmpeg binary MoviePy uses (FFMPEG_BINARY env var, imageio-ffmpeg, or PATH)."""
+    if os.getenv("FFMPEG_BINARY"):
+        return os.getenv("FFMPEG_BINARY")
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+def ffprobe_binary():
+    """Path of ffprobe (FFPROBE_BINARY env var, next to ffmpeg, or PATH), or None if there isn't one."""
+    if os.getenv("FFPROBE_BINARY"):
+        return os.getenv("FFPROBE_BINARY")
+    sibling = os.path.join(os.path.dirname(ffmpeg_binary()), "ffprobe")
+    if os.path.exists(sibling):
+        return sibling
+    return shutil.which("ffprobe")
+
+def list_encoders(ffmpeg):
+    """Names of the video encoders compiled into ffmpeg."""
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-encoders"], capture_output=True, text=True, timeout=30
+    )
+    names = set()
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        # Encoder lines look like " V....D libx264   libx264 H.264 ..."
+        if len(parts) >= 2 and parts[0].startswith("V") and len(parts[0]) == 6:
+            names.add(parts[1])
+    return names
+
+def encoder_works(ffmpeg, codec):
+    """Run a tiny test encode to check the encoder (and any device it needs) is usable."""
+    try:
+        result = subprocess.run(
+            [
+                ffmpeg, "-hide_banner", "-loglevel", "error",
+                "-f", "lavfi", "-i", "color=c=black:s=256x256:d=0.2",
+                "-c:v", codec, "-f", "null", "-",
+            ],
+            capture_output=True, timeout=30,
+        )
+        return result.returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+def _probe_key(ffmpeg):
+    # Include the host: the cache directory may be shared by nodes with different GPUs
+    try:
+        return f"{platform.node()}:{ffmpeg}:{os.path.getmtime(ffmpeg)}"
+    except OSError:
+        return f"{platform.node()}:{ffmpeg}"
+
+def _read_probe_cache(key):
+    try:
+        with open(PROBE_CACHE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f).get(key)
+    except (OSError, json.JSONDecodeError, AttributeError):
+        return None
+
+def _write_probe_cache(key, codec):
+    try:
+        directory = os.path.dirname(PROBE_CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            with open(PROBE_CACHE_PATH, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            entries = {}
+        entries = entries if isinstance(entries, dict) else {}
+        entries[key] = codec
+        tmp_path = f"{PROBE_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, PROBE_CACHE_PATH)
+    except OSError:
+        pass
+
+@lru_cache(maxsize=None)
+def detect_encoder():
+    """
+    Pick the fastest working encoder on this machine.
+
+    The result is cached in-process and on disk (keyed by the ffmpeg binary),
+    so render workers only pay for the probe once.
+    """
+    ffmpeg = ffmpeg_binary()
+    key = _probe_key(ffmpeg)
+    cached = _read_probe_cache(key)
+    if cached in ENCODER_SETTINGS:
+        return cached
+
+    try:
+        available = list_encoders(ffmpeg)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"⚠️  Could not probe ffmpeg encoders ({e}), using libx264")
+        return "libx264"
+
+    for codec in ENCODER_PREFERENCE:
+        if codec in available and encoder_works(ffmpeg, codec):
+            print(f"🎞️  Using video encoder: {codec}")
+            _write_probe_cache(key, codec)
+            return codec
+
+    print("⚠️  No preferred encoder found, using libx264")
+    return "libx264"
+
+def select_encoder(codec=None, profile="motion"):
+    """
+    Encoder settings for write_videofile.
+
+    Args:
+        codec (str, optional): Force a codec. Otherwise the VIDEO_CODEC env var
+            is used, and failing that the probed fastest encoder.
+        profile (str): "motion" for the fixed-bitrate settings, "still" for
+            quality-based rate control tuned for static slides.
+
+    Returns:
+        dict: "codec", "preset" and "ffmpeg_params"
+    """
+    codec = codec or os.getenv("VIDEO_CODEC") or detect_encoder()
+    settings = ENCODER_SETTINGS.get(codec, {"preset": "medium", "ffmpeg_params": ["-pix_fmt", "yuv420p"]})
+    ffmpeg_params = settings["ffmpeg_params"]
+    if profile == "still" and codec in STILL_SETTINGS:
+        ffmpeg_params = STILL_SETTINGS[codec]
+    return {
+        "codec": codec,
+        "preset": os.getenv("VIDEO_PRESET", settings["preset"]),
+        "ffmpeg_params": list(ffmpeg_params),
+    }
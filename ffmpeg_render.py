@@ -0,0 +1,243 @@
+import os
+import re
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import encoders
+
+def probe_duration(media_path):
+    """
+    Duration of an audio or video file in seconds, read from ffmpeg's header
+    parse without decoding any samples.
+    """
+    result = subprocess.run(
+        [encoders.ffmpeg_binary(), "-hide_banner", "-i", media_path],
+        capture_output=True, text=True, timeout=60,
+    )
+    match = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr)
+    if not match:
+        raise RuntimeError(f"❌ Could not read duration of {media_path}")
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def write_stills(frames, workdir):
+    """
+    Save frames (HxWx3 uint8 arrays) as lossless PNGs for ffmpeg to read.
+    Low compression keeps this quick; the files only live for one render.
+    """
+    from PIL import Image
+    paths = []
+    for i, frame in enumerate(frames):
+        path = os.path.join(workdir, f"still_{i:03d}.png")
+        Image.fromarray(frame).save(path, compress_level=1)
+        paths.append(path)
+    return paths
+
+def write_concat_list(still_paths, durations, list_path):
+    """
+    Write an ffmpeg concat-demuxer script that shows each still for its duration.
+    The last file is listed twice because the demuxer ignores the final duration.
+    """
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path, duration in zip(still_paths, durations):
+            f.write(f"file '{os.path.abspath(path)}'\n")
+            f.write(f"duration {duration:.6f}\n")
+        f.write(f"file '{os.path.abspath(still_paths[-1])}'\n")
+
+def run_ffmpeg(args):
+    """Run ffmpeg with args, raising with its stderr on failure."""
+    cmd = [encoders.ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y"] + args
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"❌ ffmpeg failed ({result.returncode}): {result.stderr.strip()}")
+
+def slide_start_times(durations):
+    """Timestamps (seconds) at which each slide after the first appears."""
+    times, elapsed = [], 0.0
+    for duration in durations[:-1]:
+        elapsed += duration
+        times.append(elapsed)
+    return times
+
+def keyframe_args(durations):
+    """ffmpeg args that force a keyframe exactly at every slide change."""
+    times = slide_start_times(durations)
+    if not times:
+        return []
+    return ["-force_key_frames", ",".join(f"{t:.3f}" for t in times)]
+
+def render_stills(frames, durations, audio_path, output_path, encoder, fps=24, variable_frame_rate=False):
+    """
+    Render a slideshow directly with ffmpeg: the concat demuxer shows each
+    still for its duration and the audio is muxed in, with no per-frame
+    work in Python.
+
+    Args:
+        frames (list): Padded HxWx3 uint8 frames, in display order
+        durations (list): Seconds each frame is shown
+        audio_path (str): Audio track to mux in
+        output_path (str): Output .mp4 path
+        encoder (dict): Settings from encoders.select_encoder
+        fps (int): Output frame rate
+        variable_frame_rate (bool): Emit one frame per slide, timestamped by
+            the concat list, instead of repeating each still at fps. Slide
+            changes are forced to keyframes.
+    """
+    if variable_frame_rate:
+        rate_args = ["-fps_mode", "vfr", *keyframe_args(durations)]
+    else:
+        rate_args = ["-r", str(fps)]
+
+    with tempfile.TemporaryDirectory(prefix="render_") as workdir:
+        still_paths = write_stills(frames, workdir)
+        list_path = os.path.join(workdir, "slides.txt")
+        write_concat_list(still_paths, durations, list_path)
+
+        run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-i", audio_path,
+            "-map", "0:v", "-map", "1:a",
+            *rate_args,
+            "-c:v", encoder["codec"], "-preset", encoder["preset"],
+            *encoder["ffmpeg_params"],
+            "-c:a", "aac",
+            "-shortest",
+            "-movflags", "+faststart",
+            output_path,
+        ])
+    return output_path
+
+def render_stills_renditions(groups, durations, audio_path, encoder, fps=24, variable_frame_rate=False):
+    """
+    Render several sizes of the same slideshow in one ffmpeg run. Each group's
+    stills and the audio are decoded once; the filter graph splits each group
+    and scales it to every size, and each output gets its own encoder.
+
+    Args:
+        groups (list): (frames, [(size, output_path), ...]) per aspect ratio.
+            frames are padded at the group's largest size.
+        durations (list): Seconds each frame is shown
+        audio_path (str): Audio track to mux into every output
+        encoder (dict): Settings from encoders.select_encoder
+        fps (int): Output frame rate
+        variable_frame_rate (bool): See render_stills
+    """
+    if variable_frame_rate:
+        rate_args = ["-fps_mode", "vfr", *keyframe_args(durations)]
+    else:
+        rate_args = ["-r", str(fps)]
+
+    with tempfile.TemporaryDirectory(prefix="render_") as workdir:
+        inputs, filters, outputs = [], [], []
+        for g, (frames, sizes) in enumerate(groups):
+            group_dir = os.path.join(workdir, f"group_{g}")
+            os.makedirs(group_dir)
+            list_path = os.path.join(group_dir, "slides.txt")
+            write_concat_list(write_stills(frames, group_dir), durations, list_path)
+            inputs += ["-f", "concat", "-safe", "0", "-i", list_path]
+
+            base_height, base_width = frames[0].shape[:2]
+            labels = [f"g{g}s{i}" for i in range(len(sizes))]
+            filters.append(f"[{g}:v]split={len(sizes)}" + "".join(f"[{label}]" for label in labels))
+            for label, (size, output_path) in zip(labels, sizes):
+                if size == (base_width, base_height):
+                    filters.append(f"[{label}]null[{label}out]")
+                else:
+                    filters.append(f"[{label}]scale={size[0]}:{size[1]}:flags=lanczos[{label}out]")
+                outputs.append((f"[{label}out]", output_path))
+
+        audio_index = len(groups)
+        args = inputs + ["-i", audio_path, "-filter_complex", ";".join(filters)]
+        for label, output_path in outputs:
+            args += [
+                "-map", label, "-map", f"{audio_index}:a",
+                *rate_args,
+                "-c:v", encoder["codec"], "-preset", encoder["preset"],
+                *encoder["ffmpeg_params"],
+                "-c:a", "aac",
+                "-shortest",
+                "-movflags", "+faststart",
+                output_path,
+            ]
+        run_ffmpeg(args)
+    return [output_path for _, output_path in outputs]
+
+def segment_frame_counts(durations, fps):
+    """
+    Frames in each slide's segment. Boundaries are rounded on the running
+    total, so rounding never drifts the video away from the audio.
+    """
+    counts, elapsed, previous = [], 0.0, 0
+    for duration in durations:
+        elapsed += duration
+        boundary = round(elapsed * fps)
+        counts.append(max(1, boundary - previous))
+        previous = max(boundary, previous + 1)
+    return counts
+
+def encode_segment(still_path, frame_count, output_path, encoder, fps, threads):
+    """Encode one still into a video-only segment of exactly frame_count frames."""
+    run_ffmpeg([
+        "-loop", "1", "-framerate", str(fps), "-i", still_path,
+        "-frames:v", str(frame_count),
+        "-c:v", encoder["codec"], "-preset", encoder["preset"],
+        *encoder["ffmpeg_params"],
+        "-threads", str(threads),
+        "-an", output_path,
+    ])
+    return output_path
+
+def render_segments(frames, durations, audio_path, output_path, encoder, fps=24, max_workers=None):
+    """
+    Render a slideshow by encoding every slide as its own segment in parallel
+    and joining them with a stream copy, then muxing the audio in.
+
+    Each segment starts on a slide change, so every join lands on a keyframe
+    and the concat needs no re-encode. All segments share the same encoder
+    settings and frame rate, which the stream copy requires.
+
+    Args:
+        frames (list): Padded HxWx3 uint8 frames, in display order
+        durations (list): Seconds each frame is shown
+        audio_path (str): Audio track to mux in
+        output_path (str): Output .mp4 path
+        encoder (dict): Settings from encoders.select_encoder
+        fps (int): Output frame rate
+        max_workers (int, optional): Segments encoded at once. Defaults to the
+            RENDER_SEGMENT_WORKERS env var, then the core count.
+    """
+    max_workers = max_workers or int(os.getenv("RENDER_SEGMENT_WORKERS", 0)) or os.cpu_count() or 1
+    max_workers = min(max_workers, len(frames))
+    # Split the cores between concurrent encoders instead of oversubscribing them
+    threads = max(1, (os.cpu_count() or 1) // max_workers)
+
+    with tempfile.TemporaryDirectory(prefix="render_") as workdir:
+        still_paths = write_stills(frames, workdir)
+        frame_counts = segment_frame_counts(durations, fps)
+        segment_paths = [os.path.join(workdir, f"segment_{i:03d}.mp4") for i in range(len(still_paths))]
+
+        # Each encode is an ffmpeg child process, so threads are enough to use every core
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(encode_segment, still, count, segment, encoder, fps, threads)
+                for still, count, segment in zip(still_paths, frame_counts, segment_paths)
+            ]
+            for future in futures:
+                future.result()
+
+        list_path = os.path.join(workdir, "segments.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in segment_paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+
+        run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-i", audio_path,
+            "-map", "0:v", "-map", "1:a",
+            "-c:v", "copy",
+            "-c:a", "aac",
+            "-shortest",
+            "-movflags", "+faststart",
+            output_path,
+        ])
+    return output_path
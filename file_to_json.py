@@ -3,6 +3,9 @@ import os
 from datetime import datetime
 import groq_query
 import image_fetch
+import manifest
+import dedup
+import stages
 
 def create_json_from_file(input_file_path="input/input.txt", output_folder="output"):
     """
@@ -13,8 +16,11 @@ def create_json_from_file(input_file_path="input/input.txt", output_folder="outp
         output_folder (str): The folder to save JSON files (default: "output")
     
     Returns:
-        tuple: (folder_path, summary) - The folder path and summary text
+        tuple: (folder_path, summary, duplicate) - The folder path, the summary text,
+            and whether the story is a copy of an earlier job (folder_path is then
+            that job's folder and its audio and video must not be regenerated)
     """
+    folder_path = None
     try:
         # Check if input file exists
         if not os.path.exists(input_file_path):
@@ -42,17 +48,41 @@ def create_json_from_file(input_file_path="input/input.txt", output_folder="outp
         print(f"Title: {title}")
         print(f"Summary length: {len(summary)} characters")
         
+        # Stable folder per input so reruns pick up where the last run stopped
+        filename = generate_filename_from_title(title, source=content)
+        
+        # Create nested folder structure: output/<folder_name>/<json_file>
+        folder_path = os.path.join(output_folder, filename)
+        os.makedirs(folder_path, exist_ok=True)
+        
+        filepath = os.path.join(folder_path, f"{filename}.json")
+        
+        run_manifest = manifest.Manifest(folder_path)
+        json_hash = manifest.hash_inputs(content)
+        if run_manifest.is_complete("json", json_hash):
+            with open(filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            image_fetch.refresh_json_images(run_manifest, data, filepath, json_hash)
+            print(f"⏭️  Reusing existing JSON: {filepath}")
+            return folder_path, data["summary"], False
+        
+        # Skip near-duplicates of a story we already produced
+        signature = dedup.minhash(summary)
+        duplicate = dedup.find_duplicate(output_folder, signature, folder_path)
+        if duplicate:
+            print(f"⏭️  Near-duplicate of {duplicate[0]}, skipping LLM, images, TTS and render")
+            return duplicate[0], duplicate[1], True
+        
         # Determine if content is short enough to skip summary generation
         # Use character count as threshold
         char_count = len(summary)
         
         # If content is short (like your example: ~400 chars), skip summary
-        if char_count <= 750:
-            print(f"📝 Content is short ({char_count} chars) - using original text as summary")
-            final_summary = summary
-        else:
+        needs_summary = char_count > 750
+        if needs_summary:
             print(f"📝 Content is long ({char_count} chars) - generating summary...")
-            final_summary = groq_query.get_summary({"text": summary})
+        else:
+            print(f"📝 Content is short ({char_count} chars) - using original text as summary")
         
         # Create content structure similar to news_extract format
         file_content = {
@@ -62,20 +92,17 @@ def create_json_from_file(input_file_path="input/input.txt", output_folder="outp
             "publish_date": None
         }
         
-        # Get keywords for image search
-        print("Extracting keywords...")
-        key_words = groq_query.get_key_words(file_content)
+        # Get keywords and YouTube metadata (plus the summary if needed), sent concurrently
+        print("Generating keywords, YouTube title and description...")
+        with stages.slot("llm"):
+            metadata = groq_query.get_metadata(file_content, include_summary=needs_summary)
+        final_summary = metadata["summary"] if needs_summary else summary
+        key_words = metadata["keywords"]
+        youtube_title = metadata["youtube_title"]
+        youtube_description = metadata["youtube_description"]
         
-        # Generate YouTube optimization content
-        print("Generating YouTube title...")
-        youtube_title = groq_query.get_youtube_title(file_content)
-        
-        print("Generating YouTube description...")
-        youtube_description = groq_query.get_youtube_description(file_content)
-        
-        # Fetch image URLs based on keywords
-        print("Fetching related image URLs...")
-        image_urls = image_fetch.fetch_urls(key_words)
+        # Search and download related images concurrently
+        image_urls = image_fetch.fetch_and_download_checkpointed(run_manifest, key_words, folder_path)
         
         # Create the data structure
         data = {
@@ -93,41 +120,34 @@ def create_json_from_file(input_file_path="input/input.txt", output_folder="outp
             "text_preview": final_summary[:500] + "..." if len(final_summary) > 500 else final_summary
         }
         
-        # Generate filename from title
-        filename = generate_filename_from_title(title)
-        
-        # Create nested folder structure: output/<folder_name>/<json_file>
-        folder_path = os.path.join(output_folder, filename)
-        os.makedirs(folder_path, exist_ok=True)
-        
-        filepath = os.path.join(folder_path, f"{filename}.json")
-        
-        # Download images
-        image_fetch.download_images(image_urls, folder_path)
-        
         # Save to JSON file
         with open(filepath, 'w', encoding='utf-8') as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
         
+        run_manifest.mark_complete("json", json_hash, [filepath])
+        dedup.get_index(output_folder).add(signature, folder_path)
+        
         print(f"✅ JSON file saved: {filepath}")
-        return folder_path, final_summary
+        return folder_path, final_summary, False
         
     except Exception as e:
         print(f"❌ Error processing file {input_file_path}: {str(e)}")
+        if folder_path is not None:
+            dedup.get_index(output_folder).release(folder_path)
         raise
 
-def generate_filename_from_title(title):
+def generate_filename_from_title(title, source=None):
     """
     Generate a safe filename from a title.
     
     Args:
         title (str): The title to convert
+        source (str, optional): Full input text the job ID is derived from (defaults to the title)
         
     Returns:
         str: A safe filename
     """
     import re
-    from datetime import datetime
     
     # Clean up the title and create filename
     filename_base = title.lower()
@@ -145,7 +165,5 @@ def generate_filename_from_title(title):
     if len(filename) > 50:
         filename = filename[:50]
     
-    # Add timestamp to ensure uniqueness
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    return f"{filename}_{timestamp}"
+    # Add a job ID derived from the input so reruns reuse the same folder
+    return f"{filename}_{manifest.job_id(source or title)}"
@@ -3,10 +3,97 @@ import time
 import requests
 import json
 import ast
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import RateLimiter, backoff_delay, parse_retry_after
+from llm_cache import LLMCache
+import metrics
 
 groq_api_key = os.getenv("GROQ_API_KEY", "")
+# Overridable so the pipeline can be pointed at a local fake of the endpoint
+groq_api_url = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
 
-def query_groq(prompt: str, model="llama3-70b-8192") -> str:
+# Shared across every thread so the fan-out never exceeds this many in-flight requests
+max_concurrent_requests = int(os.getenv("GROQ_MAX_CONCURRENCY", "4"))
+_request_slots = threading.BoundedSemaphore(max_concurrent_requests)
+
+# Client-side quota, shared by every caller in the process
+default_model = "llama3-70b-8192"
+fallback_models = [m.strip() for m in os.getenv("GROQ_FALLBACK_MODELS", "llama3-8b-8192").split(",") if m.strip()]
+max_retries = int(os.getenv("GROQ_MAX_RETRIES", "4"))
+_rate_limiter = RateLimiter(
+    requests_per_minute=int(os.getenv("GROQ_RPM", "30")),
+    tokens_per_minute=int(os.getenv("GROQ_TPM", "6000")),
+)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Persistent response cache so reruns and crash recovery cost no API calls
+cache_enabled = os.getenv("GROQ_CACHE", "1") != "0"
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Return the shared LLM response cache, creating it on first use (None if disabled)."""
+    global _response_cache
+    if not cache_enabled:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = LLMCache(
+                path=os.getenv("GROQ_CACHE_PATH", "cache/llm_cache.sqlite3"),
+                ttl=int(os.getenv("GROQ_CACHE_TTL", str(7 * 24 * 3600))),
+                max_entries=int(os.getenv("GROQ_CACHE_MAX_ENTRIES", "5000")),
+            )
+        return _response_cache
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    """Token cost of a request against the tokens-per-minute budget (prompt plus completion budget)."""
+    return count_tokens(prompt) + max_tokens
+
+def query_groq(prompt: str, model=None, max_tokens=2500) -> str:
+    """
+    Send a prompt to Groq, waiting only when the client-side quota requires it.
+
+    Retryable failures (429 and 5xx) are retried with exponential backoff and jitter,
+    honouring Retry-After. Once a model runs out of retries the next model in the
+    fallback chain is tried.
+    """
+    model = model or default_model
+    with metrics.span("llm", model=model) as span:
+        span.bytes_in += len(prompt.encode("utf-8"))
+        cache = get_response_cache()
+        cache_key = LLMCache.make_key(model, prompt, max_tokens)
+        if cache is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                span.cache_hits += 1
+                span.bytes_out += len(cached.encode("utf-8"))
+                print(f"💾 Groq cache hit ({cache.hits} hits / {cache.misses} misses)")
+                return cached
+            span.cache_misses += 1
+
+        models = [model] + [m for m in fallback_models if m != model]
+        last_error = None
+        for candidate in models:
+            try:
+                final_response = _query_model(prompt, candidate, max_tokens, span)
+                span.bytes_out += len(final_response.encode("utf-8"))
+                if cache is not None:
+                    # Keyed by the model that answered, so a fallback answer is
+                    # never served later as the requested model's
+                    cache.set(LLMCache.make_key(candidate, prompt, max_tokens), final_response)
+                return final_response
+            except requests.exceptions.HTTPError as http_err:
+                last_error = http_err
+                status = http_err.response.status_code if http_err.response is not None else None
+                if status not in RETRYABLE_STATUS:
+                    raise
+                print(f"🔁 Model {candidate} exhausted its retries, trying next fallback model...")
+        raise last_error
+
+def _query_model(prompt: str, model: str, max_tokens: int, span=None) -> str:
     headers = {
         "Authorization": f"Bearer {groq_api_key}",
         "Content-Type": "application/json",
@@ -15,36 +102,181 @@ def query_groq(prompt: str, model="llama3-70b-8192") -> str:
     body = {
         "model": model,
         "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 2500
+        "max_tokens": max_tokens
     }
-    time.sleep(1)  # Delay to reduce risk of rate limiting
-    try:
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            json=body,
-            headers=headers
-        )
-        response.raise_for_status()
+    token_count = estimate_tokens(prompt, max_tokens)
+    for attempt in range(max_retries + 1):
+        response = None
         try:
-            final_response = response.json()["choices"][0]["message"]["content"]
-            print(f"✅ Groq response: {final_response}")
-            return final_response
-        except json.JSONDecodeError as json_err:
-            print(f"❌ JSONDecodeError: {json_err}")
-            print(f"⚠️ Raw response text: {response.text}")
+            _rate_limiter.acquire(token_count)
+            with _request_slots:
+                response = requests.post(
+                    groq_api_url,
+                    json=body,
+                    headers=headers
+                )
+            response.raise_for_status()
+            try:
+                data = response.json()
+                final_response = data["choices"][0]["message"]["content"]
+                # The reservation assumed the whole completion budget was used
+                used = (data.get("usage") or {}).get("total_tokens")
+                if isinstance(used, int):
+                    _rate_limiter.refund(token_count - used)
+                print(f"✅ Groq response: {final_response}")
+                return final_response
+            except json.JSONDecodeError as json_err:
+                print(f"❌ JSONDecodeError: {json_err}")
+                print(f"⚠️ Raw response text: {response.text}")
+                raise
+        except requests.exceptions.HTTPError as http_err:
+            print(f"❌ GROQ HTTP error occurred: {http_err}")
+            if response.status_code not in RETRYABLE_STATUS or attempt == max_retries:
+                raise
+            retry_after = response.headers.get("Retry-After")
+            delay = backoff_delay(attempt, retry_after=retry_after)
+            if parse_retry_after(retry_after) is not None:
+                _rate_limiter.penalize(delay)
+            print(f"🔁 Retrying {model} in {delay:.2f}s (attempt {attempt + 1}/{max_retries})...")
+            if span is not None:
+                span.retries += 1
+            time.sleep(delay)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as req_err:
+            print(f"❌ RequestException occurred: {req_err}")
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"🔁 Retrying {model} in {delay:.2f}s (attempt {attempt + 1}/{max_retries})...")
+            if span is not None:
+                span.retries += 1
+            time.sleep(delay)
+        except requests.exceptions.RequestException as req_err:
+            print(f"❌ RequestException occurred: {req_err}")
+            raise
+        except Exception as e:
+            print(f"❌ An unexpected error occurred: {e}")
             raise
-    except requests.exceptions.HTTPError as http_err:
-        print(f"❌ GROQ HTTP error occurred: {http_err}")
-        if response.status_code == 429 and model != "llama3-70b-8192":
-            print("🔁 Retrying with fallback model...")
-            return query_groq(prompt, model="llama3-13b-4096")
-        raise
-    except requests.exceptions.RequestException as req_err:
-        print(f"❌ RequestException occurred: {req_err}")
-        raise
-    except Exception as e:
-        print(f"❌ An unexpected error occurred: {e}")
-        raise
+
+# Token budgets for the prompts (input side)
+KEYWORDS_INPUT_TOKENS = 200
+TITLE_INPUT_TOKENS = 125
+DESCRIPTION_INPUT_TOKENS = 75
+COMBINED_INPUT_TOKENS = 3000
+SUMMARY_CHUNK_TOKENS = 3000
+
+# Completion budgets (output side). These are reserved against the
+# tokens-per-minute quota up front, so they should be close to real lengths.
+SUMMARY_MAX_TOKENS = 600
+KEYWORDS_MAX_TOKENS = 150
+TITLE_MAX_TOKENS = 100
+DESCRIPTION_MAX_TOKENS = 150
+COMBINED_MAX_TOKENS = SUMMARY_MAX_TOKENS + KEYWORDS_MAX_TOKENS + TITLE_MAX_TOKENS + DESCRIPTION_MAX_TOKENS
+
+# Lines that are page furniture rather than article text
+BOILERPLATE_PATTERNS = re.compile(
+    r"^(advertisement|sponsored|subscribe\b|sign up\b|read more\b|related:|share this|"
+    r"follow us\b|click here\b|watch:|listen:|©|copyright\b|all rights reserved|"
+    r"we use cookies|accept cookies|this article was|photo:|image:|getty images)",
+    re.IGNORECASE,
+)
+
+# Loaded on first use: get_encoding may download the encoding file on a cold cache
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                _encoding = None
+            _encoding_loaded = True
+        return _encoding
+
+def count_tokens(text: str) -> int:
+    """Token count of text (tiktoken if installed, otherwise ~4 characters per token)."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+def clean_text(text: str) -> str:
+    """Drop boilerplate and repeated lines and collapse whitespace."""
+    seen = set()
+    lines = []
+    for line in text.splitlines():
+        line = re.sub(r"\s+", " ", line).strip()
+        if not line or line in seen or (len(line) < 120 and BOILERPLATE_PATTERNS.match(line)):
+            continue
+        seen.add(line)
+        lines.append(line)
+    return "\n".join(lines)
+
+def _token_cut(text: str, max_tokens: int):
+    """
+    Index to cut text at so text[:index] fits in max_tokens, preferring a
+    sentence boundary when one is reasonably close and otherwise a word
+    boundary. Always at least 1, so callers consuming text make progress.
+
+    Returns:
+        tuple: (index, ends_sentence)
+    """
+    # Binary search the longest prefix within budget
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text[:low]
+    sentence_end = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "), cut.rfind("\n"))
+    if sentence_end > len(cut) * 0.6:
+        return sentence_end + 1, True
+    space = cut.rfind(" ")
+    return max(1, space if space > 0 else low), False
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cut text to at most max_tokens, ending on a sentence boundary when one is
+    reasonably close and otherwise on a word boundary.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    index, ends_sentence = _token_cut(text, max_tokens)
+    head = text[:index].strip()
+    return head if ends_sentence else head + "..."
+
+def split_to_token_chunks(text: str, max_tokens: int) -> list:
+    """Split text into paragraph-aligned chunks of at most max_tokens each."""
+    chunks, current = [], ""
+    for paragraph in text.split("\n"):
+        while count_tokens(paragraph) > max_tokens:
+            index, _ = _token_cut(paragraph, max_tokens)
+            head = paragraph[:index].strip()
+            if current:
+                chunks.append(current)
+                current = ""
+            if head:
+                chunks.append(head)
+            paragraph = paragraph[index:].strip()
+        candidate = f"{current}\n{paragraph}".strip()
+        if current and count_tokens(candidate) > max_tokens:
+            chunks.append(current)
+            current = paragraph
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+def prepare_content(content) -> dict:
+    """Copy of content with cleaned text, so every prompt sees the same input."""
+    return {**content, "text": clean_text(content["text"])}
 
 def get_key_words(content) -> str:
     dirty_key_words = query_groq(f"""
@@ -56,7 +288,7 @@ def get_key_words(content) -> str:
     
     Article:
     Title: {content["title"]}
-    Text: {content["text"][:800]}...
+    Text: {truncate_to_tokens(content["text"], KEYWORDS_INPUT_TOKENS)}
     
     Examples of GOOD visual keywords:
     - "prison cell bars", "courthouse building", "police officer", "New York skyline"
@@ -66,21 +298,48 @@ def get_key_words(content) -> str:
     - "justice system", "reform efforts", "policy changes", "social issues"
     
     Return only the array, nothing more, no explanation.
-    """)
+    """, max_tokens=KEYWORDS_MAX_TOKENS)
     return convert_to_list(dirty_key_words)
 
 def get_summary(content: str) -> str:
-    return query_groq(f""" give me a summary of the following article: {content["text"]} 
+    """
+    Summarize the article. Text longer than SUMMARY_CHUNK_TOKENS is summarized
+    chunk by chunk in parallel (map), and the partial summaries are then
+    combined into one (reduce).
+    """
+    text = content["text"]
+    if count_tokens(text) <= SUMMARY_CHUNK_TOKENS:
+        return _summarize(text)
+
+    chunks = split_to_token_chunks(text, SUMMARY_CHUNK_TOKENS)
+    print(f"📝 Long article ({count_tokens(text)} tokens) - summarizing {len(chunks)} chunks in parallel...")
+    with ThreadPoolExecutor(max_workers=min(len(chunks), max_concurrent_requests)) as executor:
+        partials = list(executor.map(_summarize_chunk, chunks))
+
+    combined = "\n\n".join(partials)
+    return query_groq(f""" Combine these partial summaries of one article, in order, into a single summary of the whole article: {truncate_to_tokens(combined, SUMMARY_CHUNK_TOKENS)}
     
     Return only the summary, nothing more, no explanation, don't start with Here is a summary of the article: or any other text.
-    """)
+    """, max_tokens=SUMMARY_MAX_TOKENS)
+
+def _summarize(text: str) -> str:
+    return query_groq(f""" give me a summary of the following article: {text} 
+    
+    Return only the summary, nothing more, no explanation, don't start with Here is a summary of the article: or any other text.
+    """, max_tokens=SUMMARY_MAX_TOKENS)
+
+def _summarize_chunk(text: str) -> str:
+    return query_groq(f""" give me a summary of the following part of an article, keeping every key fact, name and number: {text} 
+    
+    Return only the summary, nothing more, no explanation.
+    """, max_tokens=SUMMARY_MAX_TOKENS)
 
 def get_youtube_title(content) -> str:
     """Generate a powerful YouTube Shorts title with selective CAPS for maximum clicks."""
     return query_groq(f"""
     Create a viral, edgy YouTube Shorts title for the following content:
     Title: {content["title"]}
-    Summary: {content["text"][:500]}...
+    Summary: {truncate_to_tokens(content["text"], TITLE_INPUT_TOKENS)}
 
     Guidelines:
     - Keep it under 60 characters
@@ -90,14 +349,14 @@ def get_youtube_title(content) -> str:
     - Perfect for YouTube Shorts click-through
 
     Return only the title, no quotes or explanation.
-    """)
+    """, max_tokens=TITLE_MAX_TOKENS)
 
 def get_youtube_description(content) -> str:
     """Generate a short viral description with tiered hashtags for YouTube Shorts."""
     return query_groq(f"""
     Create a short, viral YouTube Shorts description for the following article:
     Title: {content["title"]}
-    Summary: {content["text"][:300]}...
+    Summary: {truncate_to_tokens(content["text"], DESCRIPTION_INPUT_TOKENS)}
 
     Format:
     - 1 engaging sentence (no more than 100 characters)
@@ -111,7 +370,121 @@ def get_youtube_description(content) -> str:
     A tragic crash leaves 33 dead at a school. #news #breaking #tragedy #aircrash #schoolkids #shocking
 
     Return only the description with hashtags, no extra text.
-    """)
+    """, max_tokens=DESCRIPTION_MAX_TOKENS)
+
+def get_combined_metadata(content, include_summary=True) -> dict:
+    """Ask for the summary, keywords, title and description in a single JSON response.
+
+    Args:
+        content (dict): Article content with "title" and "text" keys
+        include_summary (bool): Whether to ask for a summary as well
+
+    Returns:
+        dict: Same shape as get_metadata
+
+    Raises:
+        ValueError: If the response is not a JSON object with the expected fields
+    """
+    summary_field = ""
+    if include_summary:
+        summary_field = '\n    "summary": "summary of the whole article, only the summary, no intro like Here is a summary",'
+    raw = query_groq(f"""
+    Read the following article and return a single JSON object with these fields:
+    {{{summary_field}
+    "keywords": ["6 VISUAL keywords/phrases for image search: concrete objects, people, places, buildings, photographable scenes, recognizable landmarks; no abstract concepts like reform or policy changes"],
+    "youtube_title": "viral, edgy YouTube Shorts title under 60 characters; emotionally charged words like SHOCKING, TRAGIC, BREAKING; CAPS only on key words; no quotes",
+    "youtube_description": "1 engaging sentence (max 100 characters) followed by 6-9 hashtags (2-3 broad like #news, 2-3 mid-topic, 2-3 niche); under 150 characters total"
+    }}
+
+    Article:
+    Title: {content["title"]}
+    Text: {truncate_to_tokens(content["text"], COMBINED_INPUT_TOKENS)}
+
+    Return only the JSON object, nothing more, no explanation, no code fences.
+    """, max_tokens=COMBINED_MAX_TOKENS if include_summary else COMBINED_MAX_TOKENS - SUMMARY_MAX_TOKENS)
+    return parse_combined_metadata(raw, include_summary)
+
+def parse_combined_metadata(raw, include_summary=True) -> dict:
+    """Validate a combined-metadata response and normalise it to the get_metadata shape."""
+    text = (raw or "").strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("Combined metadata response contains no JSON object")
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as json_err:
+        raise ValueError(f"Combined metadata response is not valid JSON: {json_err}")
+    if not isinstance(data, dict):
+        raise ValueError("Combined metadata response is not a JSON object")
+
+    keywords = data.get("keywords")
+    if isinstance(keywords, str):
+        keywords = convert_to_list(keywords)
+    elif isinstance(keywords, list):
+        keywords = [str(item).strip().strip('"\'') for item in keywords if item]
+    else:
+        keywords = []
+    if not keywords:
+        raise ValueError("Combined metadata response is missing 'keywords'")
+
+    required = ["youtube_title", "youtube_description"] + (["summary"] if include_summary else [])
+    result = {"keywords": keywords, "summary": None}
+    for field in required:
+        value = data.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"Combined metadata response is missing '{field}'")
+        result[field] = value.strip()
+    return result
+
+def get_metadata(content, include_summary=True, combined=True) -> dict:
+    """Generate the summary, keywords, title and description for an article.
+
+    By default a single structured call is tried first. If its response can't be
+    parsed, the four independent prompts are sent concurrently instead, sharing
+    the module-wide request slots in query_groq.
+
+    Args:
+        content (dict): Article content with "title" and "text" keys
+        include_summary (bool): Whether to generate a summary as well
+        combined (bool): Try the single structured call before the per-field calls
+
+    Returns:
+        dict: "summary" (or None), "keywords", "youtube_title", "youtube_description"
+    """
+    content = prepare_content(content)
+    summary_future = None
+    if combined:
+        # Long articles are summarized separately (map-reduce) next to the combined call
+        long_article = include_summary and count_tokens(content["text"]) > COMBINED_INPUT_TOKENS
+        try:
+            if not long_article:
+                return get_combined_metadata(content, include_summary)
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                summary_future = executor.submit(get_summary, content)
+                results = get_combined_metadata(content, include_summary=False)
+                results["summary"] = summary_future.result()
+                return results
+        except ValueError as e:
+            print(f"⚠️  Combined metadata call failed ({e}), falling back to per-field calls")
+
+    tasks = {
+        "keywords": get_key_words,
+        "youtube_title": get_youtube_title,
+        "youtube_description": get_youtube_description,
+    }
+    # A summary finished next to a failed combined call is kept, not regenerated
+    summary_done = summary_future is not None and summary_future.exception() is None
+    if include_summary and not summary_done:
+        tasks["summary"] = get_summary
+
+    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        futures = {name: executor.submit(func, content) for name, func in tasks.items()}
+        results = {name: future.result() for name, future in futures.items()}
+
+    if summary_done:
+        results["summary"] = summary_future.result()
+    results.setdefault("summary", None)
+    return results
 
 def convert_to_list(key_words):
     """Convert various string representations of lists into a Python list.
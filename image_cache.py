@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from io import BytesIO
+
+# Hashes closer than this many bits are treated as the same picture
+DUPLICATE_DISTANCE = 6
+
+def perceptual_hash(data):
+    """
+    64-bit difference hash (dHash) of image bytes.
+    Robust to re-encoding, resizing and small crops, so it catches the same
+    stock photo served from different URLs.
+    """
+    from PIL import Image
+    img = Image.open(BytesIO(data))
+    img.draft("L", (64, 64))  # Let JPEG decode at reduced scale
+    img = img.convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = list(img.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return bits
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+class PerceptualSet:
+    """
+    Thread-safe set of perceptual hashes for catching near-duplicates
+    among the images of a single article.
+    """
+
+    def __init__(self, max_distance=DUPLICATE_DISTANCE):
+        self.max_distance = max_distance
+        self.hashes = []
+        self.lock = threading.Lock()
+
+    def add_if_new(self, phash):
+        """Add phash and return True, or return False if a near-duplicate is already present."""
+        with self.lock:
+            if any(hamming_distance(phash, h) <= self.max_distance for h in self.hashes):
+                return False
+            self.hashes.append(phash)
+            return True
+
+class ImageCache:
+    """
+    Shared on-disk image store keyed by URL and by content hash.
+
+    Blobs are stored once per content hash. A perceptual-hash index maps
+    near-duplicates onto an existing blob, and the least recently used blobs
+    are evicted once the store grows past max_bytes.
+    """
+
+    def __init__(self, root="cache/images", max_bytes=500 * 1024 * 1024, max_distance=DUPLICATE_DISTANCE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_distance = max_distance
+        self.index_path = os.path.join(root, "index.json")
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if isinstance(index, dict) and "urls" in index and "blobs" in index:
+                return index
+        except (OSError, json.JSONDecodeError):
+            pass
+        return {"urls": {}, "blobs": {}}
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], f"{digest}.img")
+
+    def lookup_url(self, url):
+        """
+        Return (blob_path, phash) for a previously fetched URL, or None.
+        The hit's last_used time is only updated in memory; the next store()
+        writes it out with the rest of the index.
+        """
+        with self.lock:
+            digest = self.index["urls"].get(url)
+            blob = self.index["blobs"].get(digest) if digest else None
+            if blob is None or not os.path.exists(self._blob_path(digest)):
+                return None
+            blob["last_used"] = time.time()
+            return self._blob_path(digest), blob["phash"]
+
+    def store(self, url, data, phash):
+        """
+        Store image bytes for url and return the blob path. If a perceptually
+        identical image is already cached, the larger of the two copies is kept
+        and every URL of the pair is linked to it.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            blobs = self.index["blobs"]
+            if digest not in blobs:
+                for existing, blob in blobs.items():
+                    if hamming_distance(phash, blob["phash"]) <= self.max_distance:
+                        if blob["size"] >= len(data):
+                            digest = existing
+                        else:
+                            self._replace_blob(existing, digest)
+                        break
+            if digest not in blobs:
+                path = self._blob_path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(data)
+                blobs[digest] = {"phash": phash, "size": len(data), "last_used": time.time()}
+            else:
+                blobs[digest]["last_used"] = time.time()
+            self.index["urls"][url] = digest
+            self._evict()
+            self._save_index()
+            return self._blob_path(digest)
+
+    def _replace_blob(self, old_digest, new_digest):
+        """Drop old_digest and repoint its URLs at new_digest, which the caller writes."""
+        del self.index["blobs"][old_digest]
+        for url, digest in self.index["urls"].items():
+            if digest == old_digest:
+                self.index["urls"][url] = new_digest
+        try:
+            os.remove(self._blob_path(old_digest))
+        except OSError:
+            pass
+
+    def _evict(self):
+        blobs = self.index["blobs"]
+        total = sum(blob["size"] for blob in blobs.values())
+        if total <= self.max_bytes:
+            return
+        for digest in sorted(blobs, key=lambda d: blobs[d]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= blobs[digest]["size"]
+            del blobs[digest]
+            try:
+                os.remove(self._blob_path(digest))
+            except OSError:
+                pass
+        self.index["urls"] = {u: d for u, d in self.index["urls"].items() if d in blobs}
+
+    def copy_to(self, blob_path, file_path):
+        shutil.copyfile(blob_path, file_path)
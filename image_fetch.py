@@ -1,99 +1,338 @@
-from ddgs import DDGS
+import json
 import requests
 import os
-from PIL import Image
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 from io import BytesIO
+from image_cache import ImageCache, PerceptualSet, perceptual_hash
+import manifest
+import metrics
+import stages
+
+# Pooled HTTP session shared by every download thread
+MAX_WORKERS = 8
+PER_HOST_LIMIT = 2
+STAGE_DEADLINE = 30
+
+# Streaming download limits
+MAX_IMAGE_BYTES = 8 * 1024 * 1024
+PROBE_CHUNK_SIZE = 16 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+# Shared image store across articles (set IMAGE_CACHE=0 to disable)
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+def get_image_cache():
+    """Return the shared on-disk image cache, creating it on first use (None if disabled)."""
+    global _image_cache
+    if os.getenv("IMAGE_CACHE", "1") == "0":
+        return None
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache(
+                root=os.getenv("IMAGE_CACHE_DIR", "cache/images"),
+                max_bytes=int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(500 * 1024 * 1024))),
+            )
+        return _image_cache
+
+def get_session():
+    """Return the shared pooled session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+def _host_slot(url):
+    """Semaphore capping concurrent connections to a single host."""
+    host = urlparse(url).netloc.lower()
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(PER_HOST_LIMIT)
+        return _host_slots[host]
 
 def fetch_images(query, max_results=5):
     """
     Fetch image URLs using DuckDuckGo image search.
     """
-    try:
-        with DDGS() as ddgs:
-            print(f"🔍 Searching for images with query: '{query}'")
-            results = list(ddgs.images(query, max_results=max_results))
+    from ddgs import DDGS
+    with metrics.span("image_search"):
+        try:
+            with DDGS() as ddgs:
+                print(f"🔍 Searching for images with query: '{query}'")
+                results = list(ddgs.images(query, max_results=max_results))
             
-            if not results:
-                print("⚠️  No results found for query:", query)
-                return []
+                if not results:
+                    print("⚠️  No results found for query:", query)
+                    return []
                 
-            print(f"ℹ️  Found {len(results)} results for query: {query}")
+                print(f"ℹ️  Found {len(results)} results for query: {query}")
             
-            # Debug: Print first result structure if available
-            if results:
-                print("ℹ️  First result structure:", {k: type(v) for k, v in results[0].items()})
-                print("ℹ️  First result keys:", results[0].keys())
+                # Debug: Print first result structure if available
+                if results:
+                    print("ℹ️  First result structure:", {k: type(v) for k, v in results[0].items()})
+                    print("ℹ️  First result keys:", results[0].keys())
             
-            # Try different possible keys for image URL
-            image_urls = []
-            for r in results[:max_results]:
-                url = r.get("image") or r.get("url") or r.get("thumbnail")
-                if url and isinstance(url, str) and url.startswith(('http://', 'https://')):
-                    image_urls.append(url)
+                # Try different possible keys for image URL
+                image_urls = []
+                for r in results[:max_results]:
+                    url = r.get("image") or r.get("url") or r.get("thumbnail")
+                    if url and isinstance(url, str) and url.startswith(('http://', 'https://')):
+                        image_urls.append(url)
             
-            return image_urls
+                return image_urls
             
-    except Exception as e:
-        print(f"❌ Error in fetch_images for query '{query}': {str(e)}")
-        return []
+        except Exception as e:
+            print(f"❌ Error in fetch_images for query '{query}': {str(e)}")
+            return []
 
-def download_images(image_urls, save_dir="images"):
+def check_dimensions(url, width, height):
+    """Return True if the image size is usable for a slideshow, printing why not otherwise."""
+    # Filter out very small images (likely thumbnails or icons)
+    if width < 300 or height < 300:
+        print(f"⚠️  Skipping {url}: Image too small ({width}x{height})")
+        return False
+    
+    # Filter out very wide/narrow images (likely banners or weird crops)
+    aspect_ratio = width / height
+    if aspect_ratio > 3 or aspect_ratio < 0.3:
+        print(f"⚠️  Skipping {url}: Bad aspect ratio ({width}x{height})")
+        return False
+    return True
+
+class StageCancel:
     """
-    Download image URLs to a local directory.
+    Cancellation flag for a stage's downloads. Files are only moved into place
+    through publish(), under the same lock cancel() takes, so once cancel()
+    returns no abandoned task can add or replace a file.
     """
-    os.makedirs(save_dir, exist_ok=True)
-    successful_downloads = 0
-    
-    for idx, url in enumerate(image_urls):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancelled = False
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+
+    def publish(self, part_path, file_path):
+        """Rename part_path to file_path unless cancelled (then the part file is removed)."""
+        with self.lock:
+            if not self.cancelled:
+                os.replace(part_path, file_path)
+                return True
+        os.remove(part_path)
+        return False
+
+def _publish(part_path, file_path, cancel):
+    if cancel is None:
+        os.replace(part_path, file_path)
+        return True
+    return cancel.publish(part_path, file_path)
+
+def download_image(url, file_path, session=None, timeout=10, max_bytes=MAX_IMAGE_BYTES, seen=None, cancel=None):
+    """
+    Stream, validate and save a single image URL.
+
+    URLs already in the shared image cache are copied from disk without a
+    request. If seen (a PerceptualSet) is given, images that look like one
+    already saved for the same article are skipped.
+
+    The body is read in chunks. Format and dimensions are parsed from the header
+    as soon as enough bytes have arrived, so rejected images are abandoned
+    without downloading the rest. Bodies larger than max_bytes are never held
+    in memory.
+
+    The file is written to file_path + ".part" and renamed into place, so a
+    reader never sees a partial image. If cancel (a StageCancel) has been
+    cancelled by then, nothing is written.
+
+    Returns:
+        bool: True if the image passed validation and was saved to file_path
+    """
+    from PIL import Image, ImageFile
+    part_path = file_path + ".part"
+    with metrics.span("image_download") as span:
+        if cancel is not None and cancel.cancelled:
+            return False
+        session = session or get_session()
+        cache = get_image_cache()
+        if cache is not None:
+            cached = cache.lookup_url(url)
+            if cached is not None:
+                blob_path, phash = cached
+                try:
+                    cache.copy_to(blob_path, part_path)
+                except OSError:
+                    cached = None  # Blob evicted or replaced since the lookup; download it again
+            if cached is not None:
+                if seen is not None and not seen.add_if_new(phash):
+                    os.remove(part_path)
+                    print(f"⚠️  Skipping {url}: Near-duplicate of an image already in this article")
+                    return False
+                if not _publish(part_path, file_path, cancel):
+                    return False
+                span.cache_hits += 1
+                print(f"💾 Reused cached image: {file_path}")
+                return True
         try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()  # Raise an exception for bad status codes
+            with _host_slot(url), session.get(url, timeout=timeout, stream=True) as response:
+                response.raise_for_status()  # Raise an exception for bad status codes
             
-            # Check if the response content type is an image
-            content_type = response.headers.get('content-type', '').lower()
-            if not content_type.startswith('image/'):
-                print(f"⚠️  Skipping {url}: Not an image (content-type: {content_type})")
-                continue
+                # Check if the response content type is an image
+                content_type = response.headers.get('content-type', '').lower()
+                if not content_type.startswith('image/'):
+                    print(f"⚠️  Skipping {url}: Not an image (content-type: {content_type})")
+                    return False
             
-            # Validate that the content is actually a valid image
-            try:
-                # Try to open the image with PIL to validate it
-                img = Image.open(BytesIO(response.content))
-                img.verify()  # Verify it's a valid image
-                
-                # Re-open for size checking (verify() closes the image)
-                img = Image.open(BytesIO(response.content))
-                width, height = img.size
-                
-                # Filter out very small images (likely thumbnails or icons)
-                if width < 300 or height < 300:
-                    print(f"⚠️  Skipping {url}: Image too small ({width}x{height})")
-                    continue
-                
-                # Filter out very wide/narrow images (likely banners or weird crops)
-                aspect_ratio = width / height
-                if aspect_ratio > 3 or aspect_ratio < 0.3:
-                    print(f"⚠️  Skipping {url}: Bad aspect ratio ({width}x{height})")
-                    continue
-                
-                # If validation passes, save the file
-                file_path = os.path.join(save_dir, f"img{idx}.jpg")
-                with open(file_path, "wb") as f:
-                    f.write(response.content)
-                print(f"✅ Downloaded: {file_path} ({width}x{height})")
-                successful_downloads += 1
+                content_length = response.headers.get('content-length', '')
+                if content_length.isdigit() and int(content_length) > max_bytes:
+                    print(f"⚠️  Skipping {url}: Image too large ({int(content_length)} bytes)")
+                    return False
+            
+                # Probe the header for dimensions while streaming the body
+                parser = ImageFile.Parser()
+                body = bytearray()
+                size = None
+                try:
+                    for chunk in response.iter_content(chunk_size=PROBE_CHUNK_SIZE):
+                        if cancel is not None and cancel.cancelled:
+                            return False
+                        body.extend(chunk)
+                        span.bytes_in += len(chunk)
+                        if len(body) > max_bytes:
+                            print(f"⚠️  Skipping {url}: Image exceeds {max_bytes} bytes")
+                            return False
+                        if size is None:
+                            parser.feed(chunk)
+                            if parser.image is not None:
+                                size = parser.image.size
+                                if not check_dimensions(url, *size):
+                                    return False
                 
-            except Exception as img_error:
-                print(f"⚠️  Skipping {url}: Invalid image data ({img_error})")
-                continue
+                    if size is None:
+                        raise ValueError("could not read image header")
                 
+                    # verify() checks integrity without a full decode
+                    Image.open(BytesIO(body)).verify()
+                    phash = perceptual_hash(bytes(body))
+                except Exception as img_error:
+                    print(f"⚠️  Skipping {url}: Invalid image data ({img_error})")
+                    return False
+        
+            if seen is not None and not seen.add_if_new(phash):
+                print(f"⚠️  Skipping {url}: Near-duplicate of an image already in this article")
+                return False
+        
+            # If validation passes, save the file (via the shared cache when enabled)
+            width, height = size
+            span.bytes_out += len(body)
+            if cache is not None:
+                span.cache_misses += 1
+                cache.copy_to(cache.store(url, bytes(body), phash), part_path)
+            else:
+                with open(part_path, "wb") as f:
+                    f.write(body)
+            if not _publish(part_path, file_path, cancel):
+                return False
+            print(f"✅ Downloaded: {file_path} ({width}x{height})")
+            return True
+            
         except requests.exceptions.RequestException as e:
             print(f"❌ Failed to download {url}: {e}")
         except Exception as e:
             print(f"❌ Unexpected error downloading {url}: {e}")
+        return False
+
+def download_images(image_urls, save_dir="images"):
+    """
+    Download image URLs to a local directory.
+    """
+    os.makedirs(save_dir, exist_ok=True)
+    successful_downloads = 0
+    seen = PerceptualSet()
+    
+    for idx, url in enumerate(image_urls):
+        if download_image(url, os.path.join(save_dir, f"img{idx}.jpg"), seen=seen):
+            successful_downloads += 1
     
     print(f"📊 Successfully downloaded {successful_downloads}/{len(image_urls)} images")
 
+def fetch_and_download_parallel(words, save_dir="images", max_workers=MAX_WORKERS, deadline=STAGE_DEADLINE):
+    """
+    Search and download images for all keywords concurrently.
+
+    Each keyword's download starts as soon as its own search returns, so the
+    stage takes about as long as the slowest single search + download. Work
+    still running when the deadline passes is abandoned: it is cancelled
+    before this returns, so it can no longer write into save_dir.
+
+    Args:
+        words (list): List of keywords to search for images
+        save_dir (str): Folder to save imgN.jpg files into
+        max_workers (int): Maximum concurrent searches and downloads
+        deadline (float): Total wall-clock budget for the stage in seconds
+
+    Returns:
+        list: Image URLs found, in keyword order
+    """
+    if not words:
+        print("⚠️  No keywords provided for image search")
+        return []
+
+    os.makedirs(save_dir, exist_ok=True)
+    print(f"🔍 Fetching images for keywords: {', '.join(words)}")
+    session = get_session()
+    seen = PerceptualSet()
+    found = {}
+    successful_downloads = 0
+    stage_end = time.monotonic() + deadline
+    cancel = StageCancel()
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        pending = {executor.submit(fetch_images, word, 1): ("search", idx) for idx, word in enumerate(words)}
+        while pending:
+            remaining = stage_end - time.monotonic()
+            if remaining <= 0:
+                print(f"⏱️  Image stage deadline ({deadline}s) reached, abandoning {len(pending)} tasks")
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, idx = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"❌ Error in image {kind} for keyword '{words[idx]}': {e}")
+                    continue
+                if kind == "search":
+                    if result:
+                        found[idx] = result[0]
+                        file_path = os.path.join(save_dir, f"img{idx}.jpg")
+                        pending[executor.submit(download_image, result[0], file_path, session, seen=seen, cancel=cancel)] = ("download", idx)
+                    else:
+                        print(f"⚠️  No images found for keyword: {words[idx]}")
+                elif result:
+                    successful_downloads += 1
+    finally:
+        cancel.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    image_urls = [found[idx] for idx in sorted(found)]
+    print(f"📊 Found {len(image_urls)} images for {len(words)} keywords, downloaded {successful_downloads}")
+    return image_urls
+
 def fetch_and_download_images(words):
     image_urls = fetch_urls(words)
     download_images(image_urls)
@@ -129,4 +368,66 @@ def fetch_urls(words):
             print(f"❌ Error fetching images for keyword '{word}': {str(e)}")
     
     print(f"\n📊 Found {len(image_urls)} total images for {len(words)} keywords")
-    return image_urls
\ No newline at end of file
+    return image_urls
+
+def list_downloaded_images(folder_path):
+    """Return the imgN.jpg files previously saved into folder_path, sorted."""
+    if not os.path.isdir(folder_path):
+        return []
+    return sorted(
+        os.path.join(folder_path, f)
+        for f in os.listdir(folder_path)
+        if f.startswith("img") and f.endswith(".jpg")
+    )
+
+def fetch_and_download_checkpointed(run_manifest, key_words, folder_path):
+    """
+    Run the image stage unless a previous run already downloaded images for
+    the same keywords into folder_path.
+    
+    Args:
+        run_manifest (manifest.Manifest): Manifest of the article folder
+        key_words (list): Keywords to search images for
+        folder_path (str): Article output folder
+        
+    Returns:
+        list: Image URLs found for the keywords
+    """
+    images_hash = manifest.hash_inputs(key_words)
+    if run_manifest.is_complete("images", images_hash):
+        print("⏭️  Reusing previously downloaded images")
+        return run_manifest.get("images", "image_urls", [])
+    
+    # Clear images (and partial downloads) left behind by an earlier run
+    for path in list_downloaded_images(folder_path):
+        os.remove(path)
+    for name in os.listdir(folder_path) if os.path.isdir(folder_path) else []:
+        if name.startswith("img") and name.endswith(".jpg.part"):
+            os.remove(os.path.join(folder_path, name))
+    
+    print("Fetching related images...")
+    with stages.slot("images"):
+        image_urls = fetch_and_download_parallel(key_words, folder_path)
+    saved = list_downloaded_images(folder_path)
+    if not saved:
+        # Search rate limits and the stage deadline both end here; retry on the next run
+        print("⚠️  No images saved, the image stage will run again next time")
+        run_manifest.invalidate("images")
+        return image_urls
+    run_manifest.mark_complete("images", images_hash, saved, image_urls=image_urls)
+    return image_urls
+
+def refresh_json_images(run_manifest, data, filepath, json_hash):
+    """
+    Before reusing a finished JSON, re-run its image stage if that stage isn't
+    complete (e.g. it saved no images last time). The JSON is rewritten and
+    re-checkpointed when the image URLs change.
+    """
+    folder_path = os.path.dirname(filepath)
+    image_urls = fetch_and_download_checkpointed(run_manifest, data["keywords"], folder_path)
+    if image_urls != data.get("image_urls"):
+        data["image_urls"] = image_urls
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        run_manifest.mark_complete("json", json_hash, [filepath])
+    return data
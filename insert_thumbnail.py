@@ -1,8 +1,13 @@
+import json
 import os
-from moviepy import *
-from PIL import Image
+import subprocess
+import tempfile
+import encoders
+import ffmpeg_render
 
-def insert_thumbnail(video_path, thumbnail_path, output_path=None):
+THUMBNAIL_SECONDS = 3
+
+def insert_thumbnail(video_path, thumbnail_path, output_path=None, mode=None):
     """
     Insert a thumbnail image into the middle of a video.
     
@@ -10,6 +15,9 @@ def insert_thumbnail(video_path, thumbnail_path, output_path=None):
         video_path (str): Path to the input video file
         thumbnail_path (str): Path to the thumbnail image
         output_path (str, optional): Path to save the output video. If None, adds '_with_thumbnail' to the input filename.
+        mode (str, optional): "smart" re-encodes only the keyframe-aligned segment
+            around the thumbnail and stream-copies the rest, "full" re-encodes the
+            whole video with MoviePy. Defaults to the THUMBNAIL_MODE env var, then "smart".
     
     Returns:
         str: Path to the output video file
@@ -19,6 +27,21 @@ def insert_thumbnail(video_path, thumbnail_path, output_path=None):
         base, ext = os.path.splitext(video_path)
         output_path = f"{base}_with_thumbnail{ext}"
     
+    mode = mode or os.getenv("THUMBNAIL_MODE", "smart")
+    if mode == "smart":
+        try:
+            return insert_thumbnail_smart(video_path, thumbnail_path, output_path)
+        except Exception as e:
+            print(f"⚠️  Smart thumbnail insert failed ({e}), re-encoding the whole video")
+    
+    return insert_thumbnail_full(video_path, thumbnail_path, output_path)
+
+def insert_thumbnail_full(video_path, thumbnail_path, output_path):
+    """Overlay the thumbnail by compositing and re-encoding every frame with MoviePy."""
+    from moviepy import VideoFileClip, ImageClip, CompositeVideoClip
+    from PIL import Image
+    import numpy as np
+
     # Load the video
     video = VideoFileClip(video_path)
     
@@ -30,7 +53,6 @@ def insert_thumbnail(video_path, thumbnail_path, output_path=None):
     img = img.resize((new_width, new_height), Image.LANCZOS)
     
     # Convert PIL Image to numpy array and create ImageClip
-    import numpy as np
     thumbnail = ImageClip(np.array(img))
     
     # Set the duration of the thumbnail to 3 seconds
@@ -49,6 +71,128 @@ def insert_thumbnail(video_path, thumbnail_path, output_path=None):
     
     return output_path
 
+def probe_video(video_path):
+    """
+    Stream info and keyframe timestamps of the first video stream, read from
+    packet headers with ffprobe (nothing is decoded).
+    """
+    ffprobe = encoders.ffprobe_binary()
+    if not ffprobe:
+        raise RuntimeError("ffprobe not found")
+    info = json.loads(subprocess.run(
+        [ffprobe, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=codec_name,profile,width,height,pix_fmt,r_frame_rate:format=duration",
+         "-of", "json", video_path],
+        capture_output=True, text=True, check=True,
+    ).stdout)
+    packets = subprocess.run(
+        [ffprobe, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    keyframes = sorted(
+        float(pts) for pts, _, flags in (line.partition(",") for line in packets.splitlines())
+        if "K" in flags and pts not in ("", "N/A")
+    )
+    stream = info["streams"][0]
+    stream["duration"] = float(info["format"]["duration"])
+    stream["keyframes"] = keyframes
+    return stream
+
+def segment_frame_rate(stream, default="24"):
+    """
+    Frame rate for the re-encoded segment. Variable-frame-rate slideshows
+    report a meaningless r_frame_rate, so those get a constant default.
+    """
+    num, _, den = stream.get("r_frame_rate", "").partition("/")
+    try:
+        rate = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return default
+    return stream["r_frame_rate"] if 1 <= rate <= 60 else default
+
+def insert_thumbnail_smart(video_path, thumbnail_path, output_path):
+    """
+    Overlay the thumbnail by re-encoding only the GOP-aligned segment around
+    the middle of the video. The video before and after is stream-copied, the
+    three parts are joined without a transcode, and the audio is copied untouched.
+
+    The re-encoded part's SPS/PPS differ from the source's (rate control,
+    tuning, or a different encoder altogether), and an MP4 only stores the
+    first part's in its header. So every part is written as MPEG-TS (Annex-B)
+    with its parameter sets in-band before each keyframe, and the MP4 is muxed
+    from those parts, so decoders switch settings at each join.
+    """
+    stream = probe_video(video_path)
+    if stream["codec_name"] != "h264":
+        raise RuntimeError(f"segment re-encode only supports h264 sources, got {stream['codec_name']}")
+
+    duration = stream["duration"]
+    middle_time = duration / 2
+    overlay_start = max(0.0, middle_time - THUMBNAIL_SECONDS / 2)
+    overlay_end = min(duration, middle_time + THUMBNAIL_SECONDS / 2)
+
+    # Widen the re-encoded segment out to the surrounding keyframes
+    keyframes = stream["keyframes"] or [0.0]
+    segment_start = max([k for k in keyframes if k <= overlay_start] or [0.0])
+    later = [k for k in keyframes if k >= overlay_end]
+    segment_end = min(later) if later else duration
+    thumb_width = int(stream["width"] * 0.8) // 2 * 2
+
+    with tempfile.TemporaryDirectory(prefix="thumb_") as workdir:
+        parts = []
+        if segment_start > 0:
+            head = os.path.join(workdir, "head.ts")
+            ffmpeg_render.run_ffmpeg([
+                "-i", video_path, "-t", f"{segment_start:.6f}", "-map", "0:v:0",
+                "-c", "copy", "-bsf:v", "h264_mp4toannexb", "-f", "mpegts", head,
+            ])
+            parts.append(head)
+
+        middle = os.path.join(workdir, "middle.ts")
+        profile = (stream.get("profile") or "high").lower().replace(" ", "")
+        ffmpeg_render.run_ffmpeg([
+            "-ss", f"{segment_start:.6f}", "-t", f"{segment_end - segment_start:.6f}", "-i", video_path,
+            "-i", thumbnail_path,
+            "-filter_complex",
+            # Constant rate before the overlay: a VFR slideshow (the default "still"
+            # profile) has one frame per slide, so without it the thumbnail would
+            # only show on frames that happen to fall inside its 3 seconds
+            f"[0:v]fps={segment_frame_rate(stream)}[base];"
+            f"[1:v]scale={thumb_width}:-2:flags=lanczos[thumb];"
+            f"[base][thumb]overlay=(W-w)/2:(H-h)/2:"
+            f"enable='between(t,{overlay_start - segment_start:.6f},{overlay_end - segment_start:.6f})'[v]",
+            "-map", "[v]",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "18",
+            "-profile:v", profile if profile in ("baseline", "main", "high") else "high",
+            "-pix_fmt", stream.get("pix_fmt") or "yuv420p",
+            "-f", "mpegts", middle,
+        ])
+        parts.append(middle)
+
+        if segment_end < duration:
+            tail = os.path.join(workdir, "tail.ts")
+            ffmpeg_render.run_ffmpeg([
+                "-ss", f"{segment_end:.6f}", "-i", video_path, "-map", "0:v:0",
+                "-c", "copy", "-bsf:v", "h264_mp4toannexb", "-f", "mpegts", tail,
+            ])
+            parts.append(tail)
+
+        list_path = os.path.join(workdir, "parts.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for part in parts:
+                f.write(f"file '{part}'\n")
+
+        # Join the parts and put the original audio back, neither re-encoded
+        ffmpeg_render.run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", list_path, "-i", video_path,
+            "-map", "0:v:0", "-map", "1:a?", "-c", "copy",
+            "-movflags", "+faststart", output_path,
+        ])
+
+    print(f"✅ Thumbnail inserted (re-encoded {segment_end - segment_start:.2f}s of {duration:.2f}s)")
+    return output_path
+
 def main():
     # Define input and output paths
     input_folder = 'fix'
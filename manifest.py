@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+MANIFEST_NAME = "manifest.json"
+
+def job_id(source):
+    """
+    Stable short ID for a pipeline input (a URL or the text of an input file),
+    so reruns of the same input land in the same output folder.
+    """
+    return hashlib.sha256(source.strip().encode("utf-8")).hexdigest()[:12]
+
+def hash_inputs(*parts):
+    """
+    Hash the inputs of a stage. Parts may be strings, bytes, or
+    JSON-serialisable values.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        else:
+            data = json.dumps(part, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+def hash_files(paths):
+    """Hash the contents of files, in the given order."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode("utf-8"))
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+class Manifest:
+    """
+    Records which pipeline stages have finished in an output folder, with a
+    hash of each stage's inputs and the files it produced. A stage can be
+    skipped on rerun when its inputs are unchanged and its outputs still exist.
+    """
+
+    def __init__(self, folder_path):
+        self.folder_path = folder_path
+        self.path = os.path.join(folder_path, MANIFEST_NAME)
+        self.stages = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data.get("stages", {})
+        except (OSError, json.JSONDecodeError, AttributeError):
+            return {}
+
+    def _save(self):
+        os.makedirs(self.folder_path, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"stages": self.stages}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def is_complete(self, stage, input_hash):
+        """True if stage finished with the same inputs and all its outputs are intact."""
+        entry = self.stages.get(stage)
+        if not entry or entry.get("input_hash") != input_hash:
+            return False
+        for name, size in entry.get("outputs", {}).items():
+            path = os.path.join(self.folder_path, name)
+            if not os.path.exists(path) or os.path.getsize(path) != size:
+                return False
+        return True
+
+    def get(self, stage, key, default=None):
+        return self.stages.get(stage, {}).get(key, default)
+
+    def mark_complete(self, stage, input_hash, outputs=(), **extra):
+        """
+        Record stage as finished.
+
+        Args:
+            stage (str): Stage name
+            input_hash (str): Hash of the stage inputs (see hash_inputs)
+            outputs (iterable): Paths of files the stage produced
+            **extra: Additional JSON-serialisable values to keep with the stage
+        """
+        self.stages[stage] = {
+            "input_hash": input_hash,
+            "outputs": {
+                os.path.relpath(path, self.folder_path): os.path.getsize(path)
+                for path in outputs
+            },
+            "completed_at": datetime.now().isoformat(),
+            **extra,
+        }
+        self._save()
+
+    def invalidate(self, stage):
+        if self.stages.pop(stage, None) is not None:
+            self._save()
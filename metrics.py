@@ -0,0 +1,161 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("content_gatherer.metrics")
+
+COUNTERS = ("count", "errors", "seconds", "bytes_in", "bytes_out", "retries", "cache_hits", "cache_misses")
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+class Span:
+    """
+    Measurements for one run of a stage. Code inside a span() block adds to
+    bytes_in, bytes_out, retries, cache_hits and cache_misses as it goes.
+    """
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+def _record(stage, values):
+    with _stats_lock:
+        entry = _stats.setdefault(stage, dict.fromkeys(COUNTERS, 0))
+        for key, value in values.items():
+            entry[key] += value
+
+@contextmanager
+def span(stage, **labels):
+    """
+    Time a pipeline stage and record its duration, bytes, retries and cache
+    hits. Each finished span is also written as a structured log line.
+
+    Usage:
+        with metrics.span("tts", voice=voice_id) as s:
+            ...
+            s.bytes_out += len(audio)
+    """
+    current = Span(stage, labels)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _record(stage, {
+            "count": 1,
+            "errors": 1 if error else 0,
+            "seconds": seconds,
+            "bytes_in": current.bytes_in,
+            "bytes_out": current.bytes_out,
+            "retries": current.retries,
+            "cache_hits": current.cache_hits,
+            "cache_misses": current.cache_misses,
+        })
+        logger.info(json.dumps({
+            "event": "stage",
+            "stage": stage,
+            **labels,
+            "seconds": round(seconds, 4),
+            "bytes_in": current.bytes_in,
+            "bytes_out": current.bytes_out,
+            "retries": current.retries,
+            "cache_hits": current.cache_hits,
+            "cache_misses": current.cache_misses,
+            "error": repr(error) if error else None,
+        }, default=str))
+
+def incr(stage, counter, amount=1):
+    """Add to a counter of a stage outside of a span (e.g. a cache hit that skips the stage)."""
+    _record(stage, {counter: amount})
+
+def snapshot():
+    """Copy of the per-stage totals recorded so far."""
+    with _stats_lock:
+        return {stage: dict(values) for stage, values in _stats.items()}
+
+def drain():
+    """Return the totals recorded so far and reset them (used to ship a worker process's metrics)."""
+    with _stats_lock:
+        stats = {stage: dict(values) for stage, values in _stats.items()}
+        _stats.clear()
+        return stats
+
+def merge(stats):
+    """Add totals from drain() in another process into this process's totals."""
+    for stage, values in stats.items():
+        _record(stage, values)
+
+def to_prometheus():
+    """Render the totals in the Prometheus text exposition format."""
+    help_text = {
+        "count": ("stage_runs_total", "counter", "Number of times the stage ran"),
+        "errors": ("stage_errors_total", "counter", "Number of stage runs that raised"),
+        "seconds": ("stage_duration_seconds_total", "counter", "Total wall time spent in the stage"),
+        "bytes_in": ("stage_bytes_in_total", "counter", "Bytes sent or read by the stage"),
+        "bytes_out": ("stage_bytes_out_total", "counter", "Bytes received or produced by the stage"),
+        "retries": ("stage_retries_total", "counter", "Retries performed by the stage"),
+        "cache_hits": ("stage_cache_hits_total", "counter", "Cache hits in the stage"),
+        "cache_misses": ("stage_cache_misses_total", "counter", "Cache misses in the stage"),
+    }
+    stats = snapshot()
+    lines = []
+    for key in COUNTERS:
+        name, kind, description = help_text[key]
+        name = f"content_gatherer_{name}"
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for stage in sorted(stats):
+            lines.append(f'{name}{{stage="{stage}"}} {stats[stage][key]:g}')
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path):
+    """Write the totals to path in Prometheus text format (for node_exporter's textfile collector)."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(to_prometheus())
+    os.replace(tmp_path, path)
+
+def configure(log_path=None, prometheus_path=None):
+    """
+    Turn on metrics output for an entry point.
+
+    Args:
+        log_path (str, optional): Write structured stage logs (JSON lines) here,
+            or to stderr if "-". Defaults to the METRICS_LOG env var.
+        prometheus_path (str, optional): Write a Prometheus text file here at
+            exit. Defaults to the METRICS_PROMETHEUS_FILE env var.
+    """
+    configure_log(log_path or os.getenv("METRICS_LOG"))
+    prometheus_path = prometheus_path or os.getenv("METRICS_PROMETHEUS_FILE")
+    if prometheus_path:
+        atexit.register(write_prometheus, prometheus_path)
+
+def configure_log(log_path):
+    """
+    Write structured stage logs (JSON lines) to log_path, or to stderr if "-".
+    Worker processes call this alone: their totals go back to the parent
+    through drain(), which writes the Prometheus file.
+    """
+    if log_path and not logger.handlers:
+        handler = logging.StreamHandler() if log_path == "-" else logging.FileHandler(log_path, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
@@ -1,12 +1,187 @@
-from newspaper import Article
+import codecs
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
 
-def extract_article(url):
+HTML_CACHE_DIR = os.getenv("HTML_CACHE_DIR", "cache/html")
+FETCH_TIMEOUT = 15
+MAX_FETCH_WORKERS = 16
+PER_DOMAIN_LIMIT = 2
+USER_AGENT = "Mozilla/5.0 (compatible; content-gatherer/1.0)"
+
+_session = None
+_session_lock = threading.Lock()
+_domain_slots = {}
+_domain_slots_lock = threading.Lock()
+_parse_pool = None
+
+def get_session():
+    """Return the shared pooled session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers["User-Agent"] = USER_AGENT
+            adapter = HTTPAdapter(pool_connections=MAX_FETCH_WORKERS, pool_maxsize=MAX_FETCH_WORKERS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+def _domain_slot(url):
+    """Semaphore capping concurrent requests to a single domain."""
+    domain = urlparse(url).netloc.lower()
+    with _domain_slots_lock:
+        if domain not in _domain_slots:
+            _domain_slots[domain] = threading.BoundedSemaphore(PER_DOMAIN_LIMIT)
+        return _domain_slots[domain]
+
+def _cache_paths(url):
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    base = os.path.join(HTML_CACHE_DIR, key[:2], key)
+    return f"{base}.html", f"{base}.json"
+
+def _read_cache(url):
+    html_path, meta_path = _cache_paths(url)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(html_path, "r", encoding="utf-8") as f:
+            return f.read(), meta
+    except (OSError, json.JSONDecodeError):
+        return None, {}
+
+def _write_cache(url, html, response):
+    html_path, meta_path = _cache_paths(url)
+    os.makedirs(os.path.dirname(html_path), exist_ok=True)
+    meta = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    with open(html_path, "w", encoding="utf-8") as f:
+        f.write(html)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+def decode_html(response):
+    """
+    Text of an HTML response. When the server sends no charset, requests falls
+    back to ISO-8859-1, which garbles UTF-8 pages. In that case the page's own
+    <meta charset> is used, or else the detected encoding.
+    """
+    content_type = response.headers.get("Content-Type", "").lower()
+    if (response.encoding or "").lower() == "iso-8859-1" and "charset" not in content_type:
+        encoding = None
+        for declared in requests.utils.get_encodings_from_content(response.text):
+            try:
+                encoding = codecs.lookup(declared).name
+                break
+            except LookupError:
+                continue
+        response.encoding = encoding or response.apparent_encoding or "utf-8"
+    return response.text
+
+def fetch_html(url, session=None, timeout=FETCH_TIMEOUT):
+    """
+    Fetch the raw HTML of url through the shared session.
+
+    A cached copy is revalidated with If-None-Match / If-Modified-Since, so
+    unchanged pages come back as a 304 with no body.
+    """
+    session = session or get_session()
+    cached_html, meta = _read_cache(url)
+    headers = {}
+    if cached_html is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    with metrics.span("fetch_html") as span:
+        with _domain_slot(url):
+            response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached_html is not None:
+            span.cache_hits += 1
+            return cached_html
+        response.raise_for_status()
+        span.cache_misses += 1
+        span.bytes_in += len(response.content)
+        html = decode_html(response)
+        _write_cache(url, html, response)
+        return html
+
+def parse_html(url, html):
+    """Parse article fields out of raw HTML with newspaper (safe to run in a worker process)."""
+    # newspaper is slow to import, so only parsing workers pay for it
+    from newspaper import Article
     article = Article(url)
-    article.download()
+    article.download(input_html=html)
     article.parse()
     return {
         "title": article.title,
         "text": article.text,
         "authors": article.authors,
         "publish_date": article.publish_date
-    }
\ No newline at end of file
+    }
+
+def use_parse_pool(pool):
+    """
+    Parse articles from extract_article in pool (a ProcessPoolExecutor) instead
+    of on the calling thread, where parsing holds the GIL. Pass None to go back
+    to parsing in-thread.
+    """
+    global _parse_pool
+    _parse_pool = pool
+
+def extract_article(url):
+    with metrics.span("extract") as span:
+        html = fetch_html(url)
+        span.bytes_in += len(html.encode("utf-8"))
+        if _parse_pool is not None:
+            content = _parse_pool.submit(parse_html, url, html).result()
+        else:
+            content = parse_html(url, html)
+        span.bytes_out += len(content["text"].encode("utf-8"))
+        return content
+
+def extract_articles(urls, max_workers=MAX_FETCH_WORKERS, parse_workers=None):
+    """
+    Extract many articles at once: pages are fetched concurrently (capped per
+    domain) and each one is parsed in a process pool as soon as it arrives.
+
+    Args:
+        urls (list): URLs to extract
+        max_workers (int): Concurrent fetches
+        parse_workers (int, optional): Parser processes (defaults to the core count)
+
+    Returns:
+        dict: url -> content dict, or the Exception raised for that URL
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as fetchers, \
+            ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context("spawn")) as parsers:
+        fetches = {fetchers.submit(fetch_html, url): url for url in urls}
+        parses = {}
+        for future in as_completed(fetches):
+            url = fetches[future]
+            try:
+                parses[parsers.submit(parse_html, url, future.result())] = url
+            except Exception as e:
+                print(f"❌ Failed to fetch {url}: {e}")
+                results[url] = e
+        for future in as_completed(parses):
+            url = parses[future]
+            try:
+                results[url] = future.result()
+            except Exception as e:
+                print(f"❌ Failed to parse {url}: {e}")
+                results[url] = e
+    print(f"📊 Extracted {sum(1 for r in results.values() if isinstance(r, dict))}/{len(urls)} articles")
+    return results
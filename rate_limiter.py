@@ -0,0 +1,114 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that refills continuously at capacity per period.
+    """
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount=1):
+        """
+        Take amount tokens and return how long the caller must wait before they are valid.
+        Requests larger than the bucket are clamped so they can never block forever.
+        """
+        amount = min(float(amount), self.capacity)
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def refund(self, amount):
+        """Give back tokens that were reserved but not used (e.g. a shorter completion than budgeted)."""
+        amount = min(max(float(amount), 0.0), self.capacity)
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self, seconds):
+        """Empty the bucket so nothing is granted for the next `seconds` (used on 429s)."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class RateLimiter:
+    """
+    Client-side requests-per-minute and tokens-per-minute budget.
+    Callers only sleep when the quota actually requires it.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, token_count):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(token_count))
+        if wait > 0:
+            print(f"⏳ Rate limit budget exhausted, waiting {wait:.2f}s")
+            time.sleep(wait)
+        return wait
+
+    def refund(self, token_count):
+        """Return unused tokens from an acquire() once the real usage is known."""
+        if token_count > 0:
+            self.tokens.refund(token_count)
+
+    def penalize(self, seconds):
+        """Block new requests for `seconds`, e.g. after the server returned Retry-After."""
+        self.requests.drain(seconds)
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0, retry_after=None):
+    """
+    Exponential backoff with full jitter. A server-provided Retry-After always wins
+    when it is longer than the computed delay.
+
+    Args:
+        attempt (int): Zero-based retry attempt
+        base (float): Base delay in seconds
+        cap (float): Maximum delay in seconds
+        retry_after (str|float, optional): Value of the Retry-After header
+
+    Returns:
+        float: Seconds to wait before the next attempt
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    server_delay = parse_retry_after(retry_after)
+    if server_delay is not None:
+        delay = max(delay, server_delay)
+    return delay
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (seconds or HTTP date). Returns None if absent or unparseable."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
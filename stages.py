@@ -0,0 +1,46 @@
+import os
+import threading
+from contextlib import contextmanager
+
+# Default per-stage concurrency. Network-bound stages fan out wide, the
+# CPU-heavy render is held to the core count.
+DEFAULT_LIMITS = {
+    "extract": 16,
+    "llm": 8,
+    "images": 8,
+    "tts": 4,
+    "render": os.cpu_count() or 1,
+}
+
+_slots = {}
+_slots_lock = threading.Lock()
+
+def configure(limits=None):
+    """
+    Set the concurrency limit for each pipeline stage.
+
+    Args:
+        limits (dict, optional): Stage name -> max concurrent jobs. Stages not
+            listed keep their default limit.
+    """
+    merged = dict(DEFAULT_LIMITS)
+    merged.update(limits or {})
+    with _slots_lock:
+        _slots.clear()
+        for name, limit in merged.items():
+            _slots[name] = threading.BoundedSemaphore(max(1, int(limit)))
+
+@contextmanager
+def slot(name):
+    """
+    Hold one of the named stage's concurrency slots for the duration of the block.
+    Stages are unlimited until configure() has been called, so single-article
+    runs are unaffected.
+    """
+    with _slots_lock:
+        semaphore = _slots.get(name)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
@@ -1,7 +1,37 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import backoff_delay
+import manifest
+import metrics
 
-def tts_elevenlabs(text, output_path, api_key, voice_id="JBFqnCBsd6RMkjVDRZzb"):
+DEFAULT_VOICE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.75
+}
+
+# Local audio cache so re-renders never pay for the same TTS twice (TTS_CACHE=0 disables it)
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "cache/tts")
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Throttled or failing requests are retried with jittered backoff (honouring Retry-After)
+MAX_TTS_RETRIES = int(os.getenv("TTS_MAX_RETRIES", "4"))
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+def tts_cache_path(text, voice_id, voice_settings, previous_text=None, next_text=None):
+    """Cache file for a request, keyed by everything that affects the generated audio."""
+    key = manifest.hash_inputs(text, voice_id, voice_settings, previous_text or "", next_text or "")
+    return os.path.join(TTS_CACHE_DIR, key[:2], f"{key}.mp3")
+
+def tts_elevenlabs(text, output_path, api_key, voice_id="JBFqnCBsd6RMkjVDRZzb", previous_text=None, next_text=None,
+                   voice_settings=None, timeout=None):
     url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+    voice_settings = voice_settings or DEFAULT_VOICE_SETTINGS
 
     headers = {
         "xi-api-key": api_key,
@@ -10,31 +40,284 @@ def tts_elevenlabs(text, output_path, api_key, voice_id="JBFqnCBsd6RMkjVDRZzb"):
 
     data = {
         "text": text,
-        "voice_settings": {
-            "stability": 0.5,
-            "similarity_boost": 0.75
-        }
+        "voice_settings": voice_settings
     }
+    # Neighbouring text keeps intonation continuous across chunk boundaries
+    if previous_text:
+        data["previous_text"] = previous_text
+    if next_text:
+        data["next_text"] = next_text
+
+    with metrics.span("tts", voice=voice_id) as span:
+        span.bytes_in += len(text.encode("utf-8"))
+
+        use_cache = os.getenv("TTS_CACHE", "1") != "0"
+        cache_path = tts_cache_path(text, voice_id, voice_settings, previous_text, next_text)
+        if use_cache and os.path.exists(cache_path):
+            shutil.copyfile(cache_path, output_path)
+            span.cache_hits += 1
+            print(f"💾 Reused cached audio for {output_path}")
+            return
+        span.cache_misses += 1 if use_cache else 0
+
+        response = None
+        tmp_path = f"{output_path}.part"
+        try:
+            for attempt in range(MAX_TTS_RETRIES + 1):
+                try:
+                    with requests.post(url, json=data, headers=headers, stream=True, timeout=timeout) as response:
+                        if response.status_code in RETRYABLE_STATUS and attempt < MAX_TTS_RETRIES:
+                            delay = backoff_delay(attempt, retry_after=response.headers.get("Retry-After"))
+                            print(f"🔁 TTS returned {response.status_code}, retrying in {delay:.2f}s "
+                                  f"(attempt {attempt + 1}/{MAX_TTS_RETRIES})...")
+                            span.retries += 1
+                            time.sleep(delay)
+                            continue
+                        response.raise_for_status()
+
+                        content_type = response.headers.get("Content-Type", "")
+                        if "audio" not in content_type:
+                            print("❌ Response is not audio. Here's the message:")
+                            print(response.text)
+                            return  # Don't write invalid content to output file
 
+                        # Stream straight to disk instead of holding the whole body in memory
+                        with open(tmp_path, "wb") as f:
+                            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                                f.write(chunk)
+                                span.bytes_out += len(chunk)
+                    break
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    if attempt == MAX_TTS_RETRIES:
+                        raise
+                    delay = backoff_delay(attempt)
+                    print(f"🔁 TTS request failed ({e}), retrying in {delay:.2f}s "
+                          f"(attempt {attempt + 1}/{MAX_TTS_RETRIES})...")
+                    span.retries += 1
+                    time.sleep(delay)
+            os.replace(tmp_path, output_path)
+
+            if use_cache:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                shutil.copyfile(output_path, f"{cache_path}.part")
+                os.replace(f"{cache_path}.part", cache_path)
+
+            print(f"✅ Audio saved successfully to {output_path}")
+
+        except requests.exceptions.HTTPError as e:
+            print(f"🚨 HTTP Error: {e}")
+            print(f"Response content: {response.text}")
+            raise
+        except Exception as e:
+            print(f"🚨 Error generating TTS: {e}")
+            raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+# Longest chunk sent in one request; well under the provider's per-request limit
+MAX_CHUNK_CHARS = 1000
+MAX_TTS_WORKERS = 4
+
+def split_sentences(text, max_chars=MAX_CHUNK_CHARS):
+    """
+    Split text into chunks of whole sentences, each at most max_chars long.
+    A single sentence longer than max_chars is split at the last space that fits.
+    """
+    sentences = [s.strip() for s in re.split(r'(?<=[.!?…])\s+', text.strip()) if s.strip()]
+    chunks = []
+    current = ""
+    for sentence in sentences:
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+def concat_mp3(chunk_paths, output_path):
+    """
+    Join MP3 chunks with ffmpeg's concat demuxer and a stream copy. All chunks
+    come from the same voice and output format, so no re-encode is needed and
+    no silence is added. Going through the demuxer drops each chunk's ID3 tags
+    and Xing/Info frame, and the output gets one header covering the whole
+    file, so its duration is read correctly.
+    """
+    import encoders
+    list_path = f"{output_path}.concat.txt"
+    tmp_path = f"{output_path}.part.mp3"
     try:
-        response = requests.post(url, json=data, headers=headers)
-        response.raise_for_status()
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in chunk_paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+        subprocess.run(
+            [encoders.ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y",
+             "-f", "concat", "-safe", "0", "-i", list_path,
+             "-map", "0:a", "-c", "copy", "-map_metadata", "-1", tmp_path],
+            check=True, capture_output=True,
+        )
+        os.replace(tmp_path, output_path)
+    finally:
+        for path in (list_path, tmp_path):
+            if os.path.exists(path):
+                os.remove(path)
 
-        content_type = response.headers.get("Content-Type", "")
-        if "audio" not in content_type:
-            print("❌ Response is not audio. Here's the message:")
-            print(response.text)
-            return  # Don't write invalid content to output file
+def tts_chunked(text, output_path, api_key, voice_id="JBFqnCBsd6RMkjVDRZzb", max_workers=MAX_TTS_WORKERS, timeout=None):
+    """
+    Synthesize long text as sentence-bounded chunks in parallel, then join them
+    into a single MP3. Short text goes through a single tts_elevenlabs call.
+    """
+    chunks = split_sentences(text)
+    if len(chunks) <= 1:
+        tts_elevenlabs(text, output_path, api_key, voice_id, timeout=timeout)
+        return
+
+    print(f"🔊 Synthesizing {len(chunks)} chunks in parallel...")
+    workdir = tempfile.mkdtemp(prefix="tts_")
+    try:
+        chunk_paths = [os.path.join(workdir, f"chunk_{i:03d}.mp3") for i in range(len(chunks))]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    tts_elevenlabs, chunk, chunk_paths[i], api_key, voice_id,
+                    chunks[i - 1] if i > 0 else None,
+                    chunks[i + 1] if i + 1 < len(chunks) else None,
+                    timeout=timeout,
+                )
+                for i, chunk in enumerate(chunks)
+            ]
+            for future in futures:
+                future.result()
 
-        with open(output_path, "wb") as f:
-            f.write(response.content)
+        missing = [path for path in chunk_paths if not os.path.exists(path)]
+        if missing:
+            raise RuntimeError(f"TTS returned no audio for {len(missing)} of {len(chunks)} chunks")
 
+        concat_mp3(chunk_paths, output_path)
         print(f"✅ Audio saved successfully to {output_path}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
 
-    except requests.exceptions.HTTPError as e:
-        print(f"🚨 HTTP Error: {e}")
-        print(f"Response content: {response.text}")
-        raise
+class ElevenLabsBackend:
+    """Remote ElevenLabs synthesis (chunked, streamed and cached)."""
+
+    name = "elevenlabs"
+
+    def __init__(self, api_key=None, voice_id="JBFqnCBsd6RMkjVDRZzb", timeout=60):
+        self.api_key = api_key or os.getenv("ELEVENLABS_API_KEY")
+        self.voice_id = voice_id
+        self.timeout = timeout
+
+    def synthesize(self, text, output_path):
+        if not self.api_key:
+            raise RuntimeError("ElevenLabs backend needs an API key (ELEVENLABS_API_KEY)")
+        tts_chunked(text, output_path, self.api_key, self.voice_id, timeout=self.timeout)
+        if not os.path.exists(output_path):
+            raise RuntimeError("ElevenLabs returned no audio")
+
+class EspeakBackend:
+    """
+    Local CPU synthesis with espeak-ng, encoded to MP3 with ffmpeg.
+    Needs no network or API key, so it also works in CI.
+    """
+
+    name = "espeak"
+
+    def __init__(self, voice="en-us", words_per_minute=165, binary=None):
+        self.voice = voice
+        self.words_per_minute = words_per_minute
+        self.binary = binary or os.getenv("ESPEAK_BINARY") or shutil.which("espeak-ng") or "espeak"
+
+    def synthesize(self, text, output_path):
+        import encoders
+        with metrics.span("tts", backend=self.name) as span:
+            span.bytes_in += len(text.encode("utf-8"))
+            with tempfile.TemporaryDirectory(prefix="espeak_") as workdir:
+                wav_path = os.path.join(workdir, "speech.wav")
+                subprocess.run(
+                    [self.binary, "-v", self.voice, "-s", str(self.words_per_minute), "-w", wav_path, "--stdin"],
+                    input=text.encode("utf-8"), check=True, capture_output=True,
+                )
+                subprocess.run(
+                    [encoders.ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y",
+                     "-i", wav_path, "-c:a", "libmp3lame", "-b:a", "128k", output_path],
+                    check=True, capture_output=True,
+                )
+            span.bytes_out += os.path.getsize(output_path)
+        print(f"✅ Audio saved successfully to {output_path} (espeak)")
+
+TTS_BACKENDS = {
+    ElevenLabsBackend.name: ElevenLabsBackend,
+    EspeakBackend.name: EspeakBackend,
+}
+
+def get_backend(name, api_key=None, voice_id=None):
+    """Create a TTS backend by name ("elevenlabs" or "espeak")."""
+    if name not in TTS_BACKENDS:
+        raise ValueError(f"Unknown TTS backend: {name} (choose from {', '.join(TTS_BACKENDS)})")
+    if name == ElevenLabsBackend.name:
+        return ElevenLabsBackend(api_key, **({"voice_id": voice_id} if voice_id else {}))
+    return TTS_BACKENDS[name]()
+
+def synthesize(text, output_path, api_key=None, backend=None, fallback=None, voice_id=None):
+    """
+    Synthesize text to output_path with the chosen backend, falling back to a
+    second backend when the first fails or times out.
+
+    Args:
+        text (str): Text to speak
+        output_path (str): MP3 path to write
+        api_key (str, optional): ElevenLabs API key
+        backend (str, optional): Backend name. Defaults to the TTS_BACKEND env var, then "elevenlabs".
+        fallback (str, optional): Backend used if the first one fails. Defaults to
+            the TTS_FALLBACK env var; no fallback if unset.
+        voice_id (str, optional): ElevenLabs voice
+
+    Returns:
+        str: Name of the backend that produced the audio
+    """
+    backend = backend or os.getenv("TTS_BACKEND", "elevenlabs")
+    fallback = fallback or os.getenv("TTS_FALLBACK") or None
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    try:
+        get_backend(backend, api_key, voice_id).synthesize(text, output_path)
+        return backend
     except Exception as e:
-        print(f"🚨 Error generating TTS: {e}")
-        raise
\ No newline at end of file
+        if not fallback or fallback == backend:
+            raise
+        print(f"⚠️  TTS backend {backend} failed ({e}), falling back to {fallback}")
+        get_backend(fallback, api_key, voice_id).synthesize(text, output_path)
+        return fallback
+
+def tts_checkpointed(text, folder_path, api_key=None, voice_id="JBFqnCBsd6RMkjVDRZzb", backend=None, fallback=None):
+    """
+    Generate summary_audio.mp3 in folder_path unless a previous run already
+    produced it from the same text and voice with the requested backend.
+
+    Returns:
+        str: Path to the audio file
+    """
+    backend = backend or os.getenv("TTS_BACKEND", "elevenlabs")
+    output_path = os.path.join(folder_path, "summary_audio.mp3")
+    run_manifest = manifest.Manifest(folder_path)
+    audio_hash = manifest.hash_inputs(text, voice_id, backend)
+    if run_manifest.is_complete("audio", audio_hash):
+        print(f"⏭️  Reusing existing audio: {output_path}")
+        return output_path
+
+    used = synthesize(text, output_path, api_key, backend, fallback, voice_id)
+    # Record the backend that actually spoke, so fallback audio is redone once the
+    # requested backend works again
+    run_manifest.mark_complete("audio", manifest.hash_inputs(text, voice_id, used), [output_path], backend=used)
+    return output_path
@@ -6,43 +6,81 @@ import re
 import groq_query
 import news_extract
 import image_fetch
+import stages
+import manifest
+import dedup
 
-def create_json_from_url(url, output_folder="output"):
+def create_json_from_url(url, output_folder="output", content=None):
     """
     Extract information from a URL and save it as a JSON file.
     
     Args:
         url (str): The URL to process
         output_folder (str): The folder to save JSON files (default: "json_outputs")
+        content (dict, optional): Article already extracted by news_extract (skips extraction)
     
     Returns:
-        dict: The extracted data that was saved to JSON
+        tuple: (folder_path, summary, duplicate). duplicate is True when the
+            story is a copy of an earlier job; folder_path is then that job's
+            folder and its audio and video must not be regenerated.
     """
+    folder_path = None
     try:
         # Create output folder if it doesn't exist
         os.makedirs(output_folder, exist_ok=True)
         
-        # Extract article content
-        print(f"Extracting content from: {url}")
-        content = news_extract.extract_article(url)
+        # Stable folder per URL so reruns pick up where the last run stopped
+        filename = generate_filename_from_url(url)
         
-        # Get summary and keywords using Groq
-        print("Generating summary...")
-        summary = groq_query.get_summary(content)
+        # Create nested folder structure: output/<folder_name>/<json_file>
+        folder_path = os.path.join(output_folder, filename)
+        os.makedirs(folder_path, exist_ok=True)
         
-        print("Extracting keywords...")
-        key_words = groq_query.get_key_words(content)
+        filepath = os.path.join(folder_path, f"{filename}.json")
         
-        # Generate YouTube optimization content
-        print("Generating YouTube title...")
-        youtube_title = groq_query.get_youtube_title(content)
+        run_manifest = manifest.Manifest(folder_path)
+        json_hash = manifest.hash_inputs(dedup.canonicalize_url(url))
+        if run_manifest.is_complete("json", json_hash):
+            with open(filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            image_fetch.refresh_json_images(run_manifest, data, filepath, json_hash)
+            print(f"⏭️  Reusing existing JSON: {filepath}")
+            return folder_path, data["summary"], False
         
-        print("Generating YouTube description...")
-        youtube_description = groq_query.get_youtube_description(content)
+        # A previous run already found this story to be a copy of another job
+        duplicate_of = run_manifest.get("dedup", "duplicate_of")
+        if duplicate_of and run_manifest.is_complete("dedup", json_hash):
+            summary = dedup.read_summary(duplicate_of)
+            if summary is not None:
+                print(f"⏭️  Duplicate story, reusing {duplicate_of}")
+                return duplicate_of, summary, True
         
-        # Fetch related image URLs
-        print("Fetching related image URLs...")
-        image_urls = image_fetch.fetch_urls(key_words)
+        # Extract article content
+        if content is None:
+            print(f"Extracting content from: {url}")
+            with stages.slot("extract"):
+                content = news_extract.extract_article(url)
+        
+        # Skip syndicated copies of a story we already produced
+        signature = dedup.minhash(content["text"])
+        duplicate = dedup.find_duplicate(output_folder, signature, folder_path)
+        if duplicate:
+            duplicate_of, summary = duplicate
+            run_manifest.mark_complete("dedup", json_hash, duplicate_of=duplicate_of)
+            print(f"⏭️  Near-duplicate of {duplicate_of}, skipping LLM, images, TTS and render")
+            return duplicate_of, summary, True
+        
+        # Get summary, keywords and YouTube metadata using Groq (sent concurrently)
+        print("Generating summary, keywords, YouTube title and description...")
+        with stages.slot("llm"):
+            metadata = groq_query.get_metadata(content)
+        summary = metadata["summary"]
+        key_words = metadata["keywords"]
+        youtube_title = metadata["youtube_title"]
+        youtube_description = metadata["youtube_description"]
+        
+        # Search and download related images concurrently
+        image_urls = image_fetch.fetch_and_download_checkpointed(run_manifest, key_words, folder_path)
 
         # Create the data structure
         data = {
@@ -59,27 +97,20 @@ def create_json_from_url(url, output_folder="output"):
             "text_preview": content["text"][:500] + "..." if len(content["text"]) > 500 else content["text"]
         }
         
-        # Generate filename from URL
-        filename = generate_filename_from_url(url)
-        
-        # Create nested folder structure: output/<folder_name>/<json_file>
-        folder_path = os.path.join(output_folder, filename)
-        os.makedirs(folder_path, exist_ok=True)
-        
-        filepath = os.path.join(folder_path, f"{filename}.json")
-        
-        # Download images
-        image_fetch.download_images(image_urls, folder_path)
-        
         # Save to JSON file
         with open(filepath, 'w', encoding='utf-8') as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
         
+        run_manifest.mark_complete("json", json_hash, [filepath])
+        dedup.get_index(output_folder).add(signature, folder_path)
+        
         print(f"✅ JSON file saved: {filepath}")
-        return folder_path, summary
+        return folder_path, summary, False
         
     except Exception as e:
         print(f"❌ Error processing URL {url}: {str(e)}")
+        if folder_path is not None:
+            dedup.get_index(output_folder).release(folder_path)
         raise
 
 def generate_filename_from_url(url):
@@ -92,8 +123,8 @@ def generate_filename_from_url(url):
     Returns:
         str: A safe filename
     """
-    # Parse the URL
-    parsed = urlparse(url)
+    # Parse the canonical URL, so tracking and AMP variants get the same slug
+    parsed = urlparse(dedup.canonicalize_url(url))
     
     # Create base filename from domain and path
     domain = parsed.netloc.replace('www.', '')
@@ -113,10 +144,9 @@ def generate_filename_from_url(url):
     # Replace invalid characters with underscores
     filename = re.sub(r'[^\w\-_.]', '_', filename_base)
     
-    # Add timestamp to ensure uniqueness
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    return f"{filename}_{timestamp}"
+    # Add a job ID derived from the canonical URL so reruns and tracking/AMP
+    # variants of the same story reuse the same folder
+    return f"{filename}_{manifest.job_id(dedup.canonicalize_url(url))}"
 
 def batch_process_urls(urls, output_folder="output"):
     """
@@ -131,10 +161,16 @@ def batch_process_urls(urls, output_folder="output"):
     """
     results = []
     
+    # Fetch and parse every article up front, concurrently
+    contents = news_extract.extract_articles(urls)
+    
     for i, url in enumerate(urls, 1):
         print(f"\n--- Processing URL {i}/{len(urls)} ---")
         try:
-            result = create_json_from_url(url, output_folder)
+            content = contents.get(url)
+            if isinstance(content, Exception):
+                raise content
+            result = create_json_from_url(url, output_folder, content)
             results.append({"url": url, "status": "success", "data": result})
         except Exception as e:
             print(f"Failed to process {url}: {str(e)}")
@@ -1,16 +1,21 @@
 import os
-from moviepy import *
-from PIL import Image
+from math import gcd
+import manifest
+import encoders
+import ffmpeg_render
+import metrics
 
-def resize_and_pad(img, target_size=(1080, 1920), background_color=(0, 0, 0)):
+# MoviePy, NumPy and PIL are imported inside the functions that use them, so
+# importing this module (e.g. from app.py) stays cheap until a render starts.
+
+def fit_size(size, target_size=(1080, 1920)):
     """
-    Resize the image to fit within target_size (preserving aspect ratio),
-    and pad it with background_color to make it exactly target_size.
+    Largest (width, height) with the aspect ratio of size that fits within target_size.
     """
-    img_ratio = img.width / img.height
+    width, height = size
+    img_ratio = width / height
     target_ratio = target_size[0] / target_size[1]
 
-    # Resize while keeping aspect ratio
     if img_ratio > target_ratio:
         # Image is wider
         new_width = target_size[0]
@@ -19,7 +24,15 @@ def resize_and_pad(img, target_size=(1080, 1920), background_color=(0, 0, 0)):
         # Image is taller (or same ratio)
         new_height = target_size[1]
         new_width = round(new_height * img_ratio)
+    return new_width, new_height
 
+def resize_and_pad(img, target_size=(1080, 1920), background_color=(0, 0, 0)):
+    """
+    Resize the image to fit within target_size (preserving aspect ratio),
+    and pad it with background_color to make it exactly target_size.
+    """
+    from PIL import Image
+    new_width, new_height = fit_size(img.size, target_size)
     resized_img = img.resize((new_width, new_height), Image.LANCZOS)
 
     # Create background canvas
@@ -30,45 +43,167 @@ def resize_and_pad(img, target_size=(1080, 1920), background_color=(0, 0, 0)):
     background.paste(resized_img, (paste_x, paste_y))
     return background
 
-def create_slideshow(folder_path):
+def make_canvas(target_size=(1080, 1920), background_color=(0, 0, 0)):
+    """Letterbox background as an HxWx3 uint8 array, shared by every frame of a render."""
+    import numpy as np
+    return np.full((target_size[1], target_size[0], 3), background_color, dtype=np.uint8)
+
+def pad_to_frame(img, canvas):
+    """
+    Same result as resize_and_pad, but built directly as a NumPy frame: the
+    image is resized in one pass and copied into a copy of canvas.
+    """
+    import numpy as np
+    from PIL import Image
+    target_size = (canvas.shape[1], canvas.shape[0])
+    new_width, new_height = fit_size(img.size, target_size)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    resized_img = img.resize((new_width, new_height), Image.LANCZOS, reducing_gap=3.0)
+
+    frame = canvas.copy()
+    paste_x = (target_size[0] - new_width) // 2
+    paste_y = (target_size[1] - new_height) // 2
+    frame[paste_y:paste_y + new_height, paste_x:paste_x + new_width] = np.asarray(resized_img)
+    return frame
+
+def load_frames(img_path, canvases):
+    """
+    Decode an image file once and pad it to every canvas.
+
+    Args:
+        img_path (str): Image to load
+        canvases (dict): Base rendition size -> canvas from make_canvas
+
+    Returns:
+        dict: Base rendition size -> padded frame
+    """
+    from PIL import Image
+    img = Image.open(img_path)
+    # Decode at the smallest JPEG scale that still covers the largest canvas
+    img.draft("RGB", (max(w for w, _ in canvases), max(h for _, h in canvases)))
+    img = img.convert("RGB")
+    return {size: pad_to_frame(img, canvas) for size, canvas in canvases.items()}
+
+# Frame rate MoviePy renders still slides at; it can't write variable frame rate
+STILL_FPS = 5
+
+DEFAULT_RENDITIONS = [(1080, 1920)]
+
+def parse_renditions(value):
+    """Parse "1080x1920,720x1280" into [(1080, 1920), (720, 1280)]; None or "" gives None."""
+    if not value:
+        return None
+    return [tuple(int(n) for n in item.strip().lower().split("x")) for item in value.split(",")]
+
+def group_renditions(renditions):
+    """
+    Group rendition sizes by aspect ratio. Each group is padded once at its
+    largest size and the smaller sizes are scaled from that frame.
+
+    Returns:
+        dict: Base (largest) size -> sizes in that group, in the order given
+    """
+    by_ratio = {}
+    for width, height in renditions:
+        divisor = gcd(width, height)
+        by_ratio.setdefault((width // divisor, height // divisor), []).append((width, height))
+    return {max(sizes): sizes for sizes in by_ratio.values()}
+
+def rendition_path(folder_path, size, primary=False):
+    """Output path of a rendition; the primary one keeps the summary_video.mp4 name."""
+    if primary:
+        return os.path.join(folder_path, "summary_video.mp4")
+    return os.path.join(folder_path, f"summary_video_{size[0]}x{size[1]}.mp4")
+
+def scale_frame(frame, size):
+    """Scale a padded frame to another rendition of the same aspect ratio."""
+    import numpy as np
+    from PIL import Image
+    return np.asarray(Image.fromarray(frame).resize(size, Image.LANCZOS, reducing_gap=3.0))
+
+def create_slideshow(folder_path, use_custom_thumbnail=None, codec=None, mode=None, fps=24, profile=None,
+                     renditions=None):
+    """
+    Render the folder's images and summary_audio.mp3 into summary_video.mp4
+    (plus summary_video_WxH.mp4 for any extra renditions).
+
+    Args:
+        folder_path (str): Article output folder
+        use_custom_thumbnail (bool, optional): Insert thumbnail.jpg in the middle.
+            If None, the user is asked interactively.
+        codec (str, optional): Force a video encoder instead of the probed one
+            (see encoders.select_encoder).
+        mode (str, optional): "ffmpeg" renders the stills directly with ffmpeg,
+            "segments" encodes each slide as a separate ffmpeg segment in
+            parallel and stream-copies them together, "moviepy" composites
+            every frame through MoviePy. Defaults to the RENDER_MODE env var,
+            then "ffmpeg".
+        fps (int): Output frame rate for the "motion" profile
+        profile (str, optional): "still" encodes for static slides (variable
+            frame rate, keyframes at slide changes, quality-based rate control),
+            "motion" keeps the constant-rate, fixed-bitrate encode. Defaults to
+            the VIDEO_PROFILE env var, then "still".
+        renditions (list, optional): (width, height) sizes to produce from one
+            decode of the images and audio. The first is written to
+            summary_video.mp4. Defaults to the VIDEO_RENDITIONS env var
+            (e.g. "1080x1920,720x1280,1080x1080"), then 1080x1920 only.
+
+    Returns:
+        str: Path of the first rendition
+    """
+    mode = mode or os.getenv("RENDER_MODE", "ffmpeg")
+    profile = profile or os.getenv("VIDEO_PROFILE", "still")
     audio_path = os.path.join(folder_path, "summary_audio.mp3")
-    output_video_path = os.path.join(folder_path, "summary_video.mp4")
+    renditions = renditions or parse_renditions(os.getenv("VIDEO_RENDITIONS")) or DEFAULT_RENDITIONS
+    renditions = [tuple(size) for size in renditions]
+    output_paths = {size: rendition_path(folder_path, size, i == 0) for i, size in enumerate(renditions)}
+    output_video_path = output_paths[renditions[0]]
 
     # Ask if user wants to use a custom thumbnail
-    use_custom_thumbnail = input("\nDo you want to use a custom thumbnail? (y/n): ").strip().lower() == 'y'
+    if use_custom_thumbnail is None:
+        use_custom_thumbnail = input("\nDo you want to use a custom thumbnail? (y/n): ").strip().lower() == 'y'
     custom_thumbnail_path = os.path.join(folder_path, "thumbnail.jpg")
     
     if use_custom_thumbnail and not os.path.exists(custom_thumbnail_path):
         print(f"⚠️  Custom thumbnail not found at {custom_thumbnail_path}. Proceeding without it.")
         use_custom_thumbnail = False
 
-    # Load audio and get duration
-    audio_clip = AudioFileClip(audio_path)
-    duration = audio_clip.duration
-
-    # Load image files (sorted)
+    # Load image files (sorted), ignoring temp files left behind by an interrupted render
     image_files = sorted([
         os.path.join(folder_path, f)
         for f in os.listdir(folder_path)
-        if f.lower().endswith((".jpg", ".jpeg", ".png"))
+        if f.lower().endswith((".jpg", ".jpeg", ".png")) and not f.startswith("_padded_")
     ])
 
     if not image_files:
         raise Exception("❌ No images found in the folder.")
 
-    image_clips = []
+    # Skip the render if the same audio and images were already rendered
+    run_manifest = manifest.Manifest(folder_path)
+    render_hash = manifest.hash_inputs(
+        manifest.hash_files([audio_path] + image_files), bool(use_custom_thumbnail), fps, profile, renditions
+    )
+    if run_manifest.is_complete("video", render_hash):
+        print(f"⏭️  Reusing existing video: {output_video_path}")
+        return output_video_path
+
+    # Get audio duration (the ffmpeg path only needs the header)
+    if mode == "moviepy":
+        from moviepy import AudioFileClip
+        audio_clip = AudioFileClip(audio_path)
+        duration = audio_clip.duration
+    else:
+        duration = ffmpeg_render.probe_duration(audio_path)
+
+    # Each slide is a dict of base rendition size -> padded frame
     valid_images = []
 
-    for i, img_path in enumerate(image_files):
+    groups = group_renditions(renditions)
+    canvases = {base: make_canvas(base) for base in groups}
+    for img_path in image_files:
         try:
-            img = Image.open(img_path).convert("RGB")
-            padded_img = resize_and_pad(img)
-
-            # Save padded version temporarily
-            padded_path = os.path.join(folder_path, f"_padded_{i}.jpg")
-            padded_img.save(padded_path)
-            valid_images.append(padded_path)
-            
+            valid_images.append(load_frames(img_path, canvases))
             print(f"✅ Processed image: {img_path}")
             
         except Exception as e:
@@ -82,14 +217,11 @@ def create_slideshow(folder_path):
     if use_custom_thumbnail:
         try:
             # Process the custom thumbnail
-            img = Image.open(custom_thumbnail_path).convert("RGB")
-            padded_img = resize_and_pad(img)
-            padded_path = os.path.join(folder_path, "_padded_thumbnail.jpg")
-            padded_img.save(padded_path)
+            thumbnail_frame = load_frames(custom_thumbnail_path, canvases)
             
             # Insert in the middle of the slideshow
             middle_index = len(valid_images) // 2
-            valid_images.insert(middle_index, padded_path)
+            valid_images.insert(middle_index, thumbnail_frame)
             print(f"✅ Added custom thumbnail at position {middle_index}")
             
             # No need to adjust duration here as we'll calculate per_image_duration after this
@@ -110,36 +242,77 @@ def create_slideshow(folder_path):
     regular_duration = (duration * 0.8) / (num_images + 0.5)  # Reserve 20% extra for middle image
     middle_duration = duration - (regular_duration * (num_images - 1))  # Remaining time for middle image
     
-    for i, padded_path in enumerate(valid_images):
+    durations = []
+    for i in range(num_images):
         # Use longer duration for middle image
         clip_duration = middle_duration if i == middle_index else regular_duration
-        clip = ImageClip(padded_path).with_duration(clip_duration)
-        image_clips.append(clip)
+        durations.append(clip_duration)
         print(f"Image {i+1}/{num_images} duration: {clip_duration:.2f}s" + (" (middle, extended)" if i == middle_index else ""))
     
-    # Concatenate video
-    slideshow = concatenate_videoclips(image_clips, method="compose")
-    slideshow = slideshow.with_audio(audio_clip)
-
-    # Export video
-    slideshow.write_videofile(
-        output_video_path,
-        fps=24,
-        codec="h264_videotoolbox",      # or "hevc_videotoolbox"
-        audio_codec="aac",
-        preset="veryfast",              # still accepted by VideoToolbox
-        ffmpeg_params=[
-        "-pix_fmt", "yuv420p",      # required for wide compatibility
-        "-b:v", "3M"                # target video bitrate (adjust)
-    ]
-    )
+    # Export video with the fastest encoder available on this machine
+    encoder = encoders.select_encoder(codec, profile)
+    with metrics.span("render", mode=mode, codec=encoder["codec"], profile=profile,
+                      renditions=len(renditions)) as span:
+        render_renditions(valid_images, groups, output_paths, durations, audio_path, encoder, mode, fps,
+                          audio_clip if mode == "moviepy" else None, profile)
+        span.bytes_out += sum(os.path.getsize(path) for path in output_paths.values())
 
-    print(f"✅ Slideshow created: {output_video_path}")
+    run_manifest.mark_complete("video", render_hash, list(output_paths.values()))
+    for path in output_paths.values():
+        print(f"✅ Slideshow created: {path}")
+    return output_video_path
 
-    # Cleanup temp padded images
-    for padded in valid_images:
-        try:
-            if padded.startswith(os.path.join(folder_path, "_padded_")):
-                os.remove(padded)
-        except:
-            pass
\ No newline at end of file
+def render_renditions(slides, groups, output_paths, durations, audio_path, encoder, mode, fps,
+                      audio_clip=None, profile="motion"):
+    """
+    Encode every rendition from the already decoded slides.
+
+    The ffmpeg mode does this in a single ffmpeg run that reads each group's
+    stills and the audio once, splits and scales the video in the filter
+    graph and writes all outputs. Other modes scale the group's frames in
+    Python and render each rendition in turn.
+    """
+    if mode == "ffmpeg" and len(output_paths) > 1:
+        ffmpeg_render.render_stills_renditions(
+            [
+                ([slide[base] for slide in slides], [(size, output_paths[size]) for size in sizes])
+                for base, sizes in groups.items()
+            ],
+            durations, audio_path, encoder, fps=fps, variable_frame_rate=profile == "still",
+        )
+        return
+
+    for base, sizes in groups.items():
+        frames = [slide[base] for slide in slides]
+        for size in sizes:
+            scaled = frames if size == base else [scale_frame(frame, size) for frame in frames]
+            render_video(scaled, durations, audio_path, output_paths[size], encoder, mode, fps, audio_clip, profile)
+
+def render_video(valid_images, durations, audio_path, output_video_path, encoder, mode, fps,
+                 audio_clip=None, profile="motion"):
+    """Encode the padded frames with their durations using the given render mode."""
+    still = profile == "still"
+    if mode == "moviepy":
+        from moviepy import ImageClip, concatenate_videoclips
+        image_clips = [ImageClip(frame).with_duration(d) for frame, d in zip(valid_images, durations)]
+        
+        # Concatenate video
+        slideshow = concatenate_videoclips(image_clips, method="compose")
+        slideshow = slideshow.with_audio(audio_clip)
+
+        slideshow.write_videofile(
+            output_video_path,
+            fps=min(fps, STILL_FPS) if still else fps,
+            codec=encoder["codec"],
+            audio_codec="aac",
+            preset=encoder["preset"],
+            ffmpeg_params=encoder["ffmpeg_params"] + (ffmpeg_render.keyframe_args(durations) if still else [])
+        )
+    elif mode == "segments":
+        # Segments are constant-rate; the still profile's rate control and
+        # per-segment keyframes still apply
+        ffmpeg_render.render_segments(valid_images, durations, audio_path, output_video_path, encoder,
+                                      fps=min(fps, STILL_FPS) if still else fps)
+    else:
+        ffmpeg_render.render_stills(valid_images, durations, audio_path, output_video_path, encoder,
+                                    fps=fps, variable_frame_rate=still)
\ No newline at end of file